@@ -1,25 +1,1175 @@
 import base64
+import csv
+import gzip
+import html
+import io
 import json
+import logging
+import multiprocessing
+import queue
+import re
+import shutil
+import tempfile
+import threading
+import time
+import sys
+import uuid
+from collections import Counter, OrderedDict, deque
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 import requests
-import bcrypt
-from flask import Flask, jsonify, request, send_from_directory
-from flask_mysqldb import MySQL
+from requests.adapters import HTTPAdapter
+import click
+import MySQLdb
+import MySQLdb.cursors
+from flask import Flask, Response, g, has_app_context, has_request_context, jsonify, request, send_from_directory
+from flask.json.provider import DefaultJSONProvider
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 from dotenv import load_dotenv
 import os
+import hashing
+import schema
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 app = Flask(__name__)
 CORS(app, supports_credentials=True)
 
 load_dotenv()
 
-mysql = MySQL(app)
+# number of reverse proxies in front of the app (1 on Render); only then is X-Forwarded-For trusted for remote_addr
+app.config['PROXY_FIX_HOPS'] = int(os.getenv('PROXY_FIX_HOPS', 0))
+if app.config['PROXY_FIX_HOPS']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_FIX_HOPS'], x_proto=app.config['PROXY_FIX_HOPS'])
 
 app.config['MYSQL_HOST'] = os.getenv('MYSQL_HOST')
 app.config['MYSQL_USER'] = os.getenv('MYSQL_USER')
 app.config['MYSQL_PASSWORD'] = os.getenv('MYSQL_PASSWORD')
 app.config['MYSQL_DB'] = os.getenv('MYSQL_DB')
 app.config['MYSQL_PORT'] = int(os.getenv('MYSQL_PORT'))
+app.config['MYSQL_CHARSET'] = os.getenv('MYSQL_CHARSET', 'utf8')
+app.config['MYSQL_POOL_SIZE'] = int(os.getenv('MYSQL_POOL_SIZE', 5))
+app.config['MYSQL_POOL_MAX_OVERFLOW'] = int(os.getenv('MYSQL_POOL_MAX_OVERFLOW', 5))
+app.config['MYSQL_POOL_RECYCLE'] = float(os.getenv('MYSQL_POOL_RECYCLE', 3600))
+app.config['MYSQL_POOL_TIMEOUT'] = float(os.getenv('MYSQL_POOL_TIMEOUT', 10))
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+app.config['QUERY_GUARD_MODE'] = os.getenv('QUERY_GUARD_MODE', 'off')
+app.config['QUERY_REPEAT_THRESHOLD'] = int(os.getenv('QUERY_REPEAT_THRESHOLD', 5))
+app.config['SLOW_QUERY_MS'] = float(os.getenv('SLOW_QUERY_MS', 0))
+app.config['SLOW_QUERY_LOG'] = os.getenv('SLOW_QUERY_LOG')
+
+slow_query_logger = logging.getLogger('slow_queries')
+if app.config['SLOW_QUERY_LOG']:
+    slow_query_handler = logging.FileHandler(app.config['SLOW_QUERY_LOG'])
+    slow_query_handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+    slow_query_logger.addHandler(slow_query_handler)
+    slow_query_logger.setLevel(logging.INFO)
+    slow_query_logger.propagate = False
+
+
+class QueryPatternError(Exception):
+    pass
+
+
+class QueryGuardReport:
+    def __init__(self, threshold, slow_ms):
+        self.threshold = threshold
+        self.slow_ms = slow_ms
+        self.repeated = []
+        self.slow = []
+
+    @property
+    def violations(self):
+        return self.repeated + self.slow
+
+
+query_guard_reports = []
+
+
+def fingerprint_query(query):
+    normalized = re.sub(r"'(?:[^'\\]|\\.)*'", "?", query)
+    normalized = re.sub(r"/\*.*?\*/|--[^\n]*|#[^\n]*", " ", normalized, flags=re.S).lower()
+    normalized = re.sub(r"\b\d+(?:\.\d+)?\b", "?", normalized).replace('%s', '?')
+    # IN lists, VALUES tuples and derived-table unions vary in length with the data, not with the code
+    normalized = re.sub(r"\(\s*\?(?:\s*,\s*\?)*\s*\)", "(?+)", normalized)
+    normalized = re.sub(r"\(\?\+\)(?:\s*,\s*\(\?\+\))+", "(?+)", normalized)
+    normalized = re.sub(r"(?:\s+union\s+all\s+select\s+\?(?:\s*,\s*\?)*)+", " union all select ?+", normalized)
+    return ' '.join(normalized.split())
+
+
+def query_guard_enabled():
+    return app.config['QUERY_GUARD_MODE'] != 'off' or bool(query_guard_reports)
+
+
+def record_query(query, elapsed_ms):
+    stats = g.setdefault('db_stats', {'count': 0, 'total_ms': 0.0, 'slowest_ms': 0.0, 'slowest_statement': None})
+    stats['count'] += 1
+    stats['total_ms'] += elapsed_ms
+    if elapsed_ms > stats['slowest_ms']:
+        stats['slowest_ms'] = elapsed_ms
+        stats['slowest_statement'] = ' '.join(query.split())[:500]
+
+    slow_ms = app.config['SLOW_QUERY_MS']
+    if query_guard_enabled() or (slow_ms and elapsed_ms >= slow_ms):
+        fingerprint = fingerprint_query(query)
+        g.setdefault('db_fingerprints', Counter())[fingerprint] += 1
+        if slow_ms and elapsed_ms >= slow_ms:
+            route = request.url_rule.rule if has_request_context() and request.url_rule else '-'
+            slow_query_logger.warning('%.2f ms %s %s', elapsed_ms, route, fingerprint)
+            g.setdefault('db_slow_queries', []).append({'statement': fingerprint, 'ms': elapsed_ms})
+
+
+def check_query_patterns():
+    fingerprints = g.get('db_fingerprints')
+    if not fingerprints:
+        return None
+
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    counts = [{'route': route, 'statement': statement, 'count': count} for statement, count in fingerprints.items()]
+    threshold = app.config['QUERY_REPEAT_THRESHOLD']
+    repeated = [item for item in counts if threshold and item['count'] > threshold]
+    for report in query_guard_reports:
+        report.repeated += [item for item in counts if report.threshold and item['count'] > report.threshold]
+        if report.slow_ms:
+            report.slow += [dict(item, route=route) for item in g.get('db_slow_queries', []) if item['ms'] >= report.slow_ms]
+
+    for item in repeated:
+        app.logger.warning('%s ran the same statement %d times: %s', route, item['count'], item['statement'])
+    if repeated and app.config['QUERY_GUARD_MODE'] == 'fail':
+        return jsonify({'error': 'Repeated query pattern detected', 'repeated': repeated}), 500
+    return None
+
+
+@contextmanager
+def query_guard(threshold=None, slow_ms=None):
+    report = QueryGuardReport(app.config['QUERY_REPEAT_THRESHOLD'] if threshold is None else threshold, slow_ms)
+    query_guard_reports.append(report)
+    try:
+        yield report
+    finally:
+        query_guard_reports.remove(report)
+    if report.violations:
+        lines = [f"{item['route']}: {item['count']}x {item['statement']}" for item in report.repeated]
+        lines += [f"{item['route']}: {item['ms']:.2f} ms {item['statement']}" for item in report.slow]
+        raise QueryPatternError('Query anti-patterns detected:\n' + '\n'.join(lines))
+
+
+EXPLAINABLE_STATEMENT = re.compile(r"\s*(?:select|insert|update|delete|replace|with)\b", re.I)
+statement_captures = []
+
+
+def capture_statement(cursor, query, args):
+    if not EXPLAINABLE_STATEMENT.match(query):
+        return
+    fingerprint = fingerprint_query(query)
+    route = request.url_rule.rule if has_request_context() and request.url_rule else '-'
+    for captured in statement_captures:
+        if fingerprint not in captured:
+            captured[fingerprint] = {'route': route, 'fingerprint': fingerprint, 'statement': cursor.mogrify(query, args)}
+
+
+@contextmanager
+def capture_statements():
+    # one statement per fingerprint with its parameters filled in, as input for check-query-plans
+    captured = {}
+    statement_captures.append(captured)
+    try:
+        yield captured
+    finally:
+        statement_captures.remove(captured)
+
+
+class TrackedCursor:
+    def __init__(self, cursor, pool):
+        self.cursor = cursor
+        self.pool = pool
+
+    def _timed(self, method, query, args, sample_args):
+        self.pool.count_query()
+        started = time.perf_counter()
+        try:
+            result = method(query, args)
+        finally:
+            if has_app_context():
+                record_query(query, (time.perf_counter() - started) * 1000)
+        if statement_captures:
+            capture_statement(self.cursor, query, sample_args)
+        return result
+
+    def execute(self, query, args=None):
+        return self._timed(self.cursor.execute, query, args, args)
+
+    def executemany(self, query, args):
+        args = list(args)
+        if not args:
+            return self.cursor.executemany(query, args)
+        if MySQLdb.cursors.RE_INSERT_VALUES.match(query):
+            return self._timed(self.cursor.executemany, query, args, args[0])
+        # mysqlclient only folds INSERT ... VALUES (%s, ...) into one statement, anything else is one round trip per row
+        self.cursor.rowcount = sum(self.execute(query, row) for row in args)
+        return self.cursor.rowcount
+
+    def __iter__(self):
+        return iter(self.cursor)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+
+class PooledConnection:
+    def __init__(self, pool, raw, created_at):
+        self.pool = pool
+        self.raw = raw
+        self.created_at = created_at
+        self._cursors = []
+
+    def cursor(self, *args, **kwargs):
+        cursor = self.raw.cursor(*args, **kwargs)
+        self._cursors.append(cursor)
+        return TrackedCursor(cursor, self.pool)
+
+    def __getattr__(self, name):
+        return getattr(self.raw, name)
+
+    def release(self, discard=False):
+        if discard:
+            # an unfinished unbuffered result would have to be read to the end before the connection is reusable
+            self._cursors = []
+            self.pool.checkin(self.raw, self.created_at, True)
+            return
+        for cursor in self._cursors:
+            try:
+                cursor.close()
+            except MySQLdb.Error:
+                discard = True
+        self._cursors = []
+        try:
+            # end any transaction a handler left open so the next checkout starts clean
+            self.raw.rollback()
+        except MySQLdb.Error:
+            discard = True
+        self.pool.checkin(self.raw, self.created_at, discard)
+
+
+class ConnectionPool:
+    def __init__(self, app):
+        self.app = app
+        self._idle = deque()
+        self._open = 0
+        self._in_use = 0
+        self._pid = os.getpid()
+        self._condition = threading.Condition()
+        self.queries = 0
+        self.checkouts = 0
+        self.waits = 0
+        self.timeouts = 0
+        self.created = 0
+        self.recycled = 0
+        self.ping_failures = 0
+        self.wait_ms_total = 0.0
+        self.wait_ms_max = 0.0
+        self.peak_in_use = 0
+
+    def _connect(self):
+        config = self.app.config
+        return MySQLdb.connect(host=config['MYSQL_HOST'], user=config['MYSQL_USER'], password=config['MYSQL_PASSWORD'],
+                               database=config['MYSQL_DB'], port=config['MYSQL_PORT'], charset=config['MYSQL_CHARSET'],
+                               use_unicode=True)
+
+    def _close(self, raw):
+        try:
+            raw.close()
+        except MySQLdb.Error:
+            pass
+
+    def checkout(self):
+        config = self.app.config
+        started = time.perf_counter()
+        deadline = time.monotonic() + config['MYSQL_POOL_TIMEOUT']
+        raw = None
+        created_at = None
+        waited = False
+
+        with self._condition:
+            if self._pid != os.getpid():
+                # connections inherited through a gunicorn fork belong to the parent
+                self._idle.clear()
+                self._open = self._in_use = 0
+                self._pid = os.getpid()
+
+            while True:
+                if self._idle:
+                    raw, created_at = self._idle.pop()
+                    break
+                if self._open < config['MYSQL_POOL_SIZE'] + config['MYSQL_POOL_MAX_OVERFLOW']:
+                    self._open += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timeouts += 1
+                    raise PoolExhausted()
+                waited = True
+                self._condition.wait(remaining)
+
+            self._in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self._in_use)
+
+        try:
+            if raw is not None and time.monotonic() - created_at > config['MYSQL_POOL_RECYCLE']:
+                self._close(raw)
+                raw = None
+                self.recycled += 1
+            if raw is not None:
+                try:
+                    raw.ping()
+                except MySQLdb.Error:
+                    self._close(raw)
+                    raw = None
+                    self.ping_failures += 1
+            if raw is None:
+                raw = self._connect()
+                created_at = time.monotonic()
+                self.created += 1
+        except Exception:
+            with self._condition:
+                self._open -= 1
+                self._in_use -= 1
+                self._condition.notify()
+            raise
+
+        wait_ms = (time.perf_counter() - started) * 1000
+        with self._condition:
+            self.checkouts += 1
+            self.waits += waited
+            self.wait_ms_total += wait_ms
+            self.wait_ms_max = max(self.wait_ms_max, wait_ms)
+
+        return PooledConnection(self, raw, created_at)
+
+    def count_query(self):
+        with self._condition:
+            self.queries += 1
+
+    def checkin(self, raw, created_at, discard=False):
+        with self._condition:
+            self._in_use -= 1
+            if discard or len(self._idle) >= self.app.config['MYSQL_POOL_SIZE']:
+                self._open -= 1
+                self._close(raw)
+            else:
+                self._idle.append((raw, created_at))
+            self._condition.notify()
+
+    def stats(self):
+        config = self.app.config
+        with self._condition:
+            capacity = config['MYSQL_POOL_SIZE'] + config['MYSQL_POOL_MAX_OVERFLOW']
+            return {
+                'size': config['MYSQL_POOL_SIZE'],
+                'max_overflow': config['MYSQL_POOL_MAX_OVERFLOW'],
+                'open': self._open,
+                'idle': len(self._idle),
+                'in_use': self._in_use,
+                'peak_in_use': self.peak_in_use,
+                'saturation': self._in_use / capacity if capacity else 0.0,
+                'queries': self.queries,
+                'checkouts': self.checkouts,
+                'waits': self.waits,
+                'timeouts': self.timeouts,
+                'created': self.created,
+                'recycled': self.recycled,
+                'ping_failures': self.ping_failures,
+                'avg_wait_ms': self.wait_ms_total / self.checkouts if self.checkouts else 0.0,
+                'max_wait_ms': self.wait_ms_max
+            }
+
+
+class PooledMySQL:
+    def __init__(self, app):
+        self.pool = ConnectionPool(app)
+        app.teardown_appcontext(self.teardown)
+
+    @property
+    def connection(self):
+        if not has_app_context():
+            return None
+        if 'mysql_connection' not in g:
+            g.mysql_connection = self.pool.checkout()
+        return g.mysql_connection
+
+    def teardown(self, exception):
+        connection = g.pop('mysql_connection', None)
+        if connection is not None:
+            connection.release()
+
+
+mysql = PooledMySQL(app)
+
+
+class TimedJSONProvider(DefaultJSONProvider):
+    @staticmethod
+    def default(o):
+        if isinstance(o, date):
+            return o.isoformat()
+        return DefaultJSONProvider.default(o)
+
+    def response(self, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return super().response(*args, **kwargs)
+        finally:
+            if has_request_context():
+                g.serialize_ms = g.get('serialize_ms', 0.0) + (time.perf_counter() - started) * 1000
+
+
+class OrjsonProvider(TimedJSONProvider):
+    # key order is left as built by the handlers, sorting every payload is most of the remaining cost
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        # Decimal prices still fall back to default() and stay strings, as with the standard provider
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
+app.config['JSON_PROVIDER'] = os.getenv('JSON_PROVIDER', 'orjson')
+if app.config['JSON_PROVIDER'] == 'orjson' and orjson is not None:
+    app.json = OrjsonProvider(app)
+else:
+    app.json = TimedJSONProvider(app)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestMetrics:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._routes = {}
+        self._statuses = {}
+        self._lock = threading.Lock()
+
+    def observe(self, route, method, status, seconds, db_stats, serialize_seconds):
+        with self._lock:
+            key = (route, method)
+            metrics = self._routes.get(key)
+            if metrics is None:
+                metrics = self._routes[key] = {
+                    'buckets': [0] * len(self.buckets), 'count': 0, 'sum': 0.0,
+                    'db_queries': 0, 'db_seconds': 0.0, 'serialize_seconds': 0.0
+                }
+            for i, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    metrics['buckets'][i] += 1
+            metrics['count'] += 1
+            metrics['sum'] += seconds
+            metrics['db_queries'] += db_stats['count']
+            metrics['db_seconds'] += db_stats['total_ms'] / 1000
+            metrics['serialize_seconds'] += serialize_seconds
+            status_key = (route, method, status)
+            self._statuses[status_key] = self._statuses.get(status_key, 0) + 1
+
+    def render(self):
+        lines = [
+            '# HELP http_request_duration_seconds Request latency by route.',
+            '# TYPE http_request_duration_seconds histogram'
+        ]
+        with self._lock:
+            routes = {key: dict(metrics, buckets=list(metrics['buckets'])) for key, metrics in self._routes.items()}
+            statuses = dict(self._statuses)
+
+        for (route, method), metrics in sorted(routes.items()):
+            for bound, count in zip(self.buckets, metrics['buckets']):
+                lines.append(f"http_request_duration_seconds_bucket{labels(route=route, method=method, le=bound)} {count}")
+            lines.append(f"http_request_duration_seconds_bucket{labels(route=route, method=method, le='+Inf')} {metrics['count']}")
+            lines.append(f"http_request_duration_seconds_sum{labels(route=route, method=method)} {metrics['sum']}")
+            lines.append(f"http_request_duration_seconds_count{labels(route=route, method=method)} {metrics['count']}")
+
+        for name, field, help_text in (
+            ('db_queries_total', 'db_queries', 'MySQL statements executed by route.'),
+            ('db_query_duration_seconds_total', 'db_seconds', 'Time spent in MySQL statements by route.'),
+            ('serialization_duration_seconds_total', 'serialize_seconds', 'Time spent serializing JSON responses by route.')
+        ):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for (route, method), metrics in sorted(routes.items()):
+                lines.append(f"{name}{labels(route=route, method=method)} {metrics[field]}")
+
+        lines.append('# HELP http_requests_total Responses by route and status code.')
+        lines.append('# TYPE http_requests_total counter')
+        for (route, method, status), count in sorted(statuses.items()):
+            lines.append(f"http_requests_total{labels(route=route, method=method, status=status)} {count}")
+
+        return lines
+
+
+request_metrics = RequestMetrics(LATENCY_BUCKETS)
+
+
+def labels(**values):
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values.values())
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(values, escaped)) + '}'
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_timing(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+
+    if query_guard_enabled():
+        rejected = check_query_patterns()
+        if rejected is not None:
+            response = app.make_response(rejected)
+
+    total_ms = (time.perf_counter() - started) * 1000
+    db_stats = g.get('db_stats', {'count': 0, 'total_ms': 0.0, 'slowest_ms': 0.0, 'slowest_statement': None})
+    serialize_ms = g.get('serialize_ms', 0.0)
+    compress_ms = g.get('compress_ms', 0.0)
+    app_ms = max(total_ms - db_stats['total_ms'] - serialize_ms - compress_ms, 0.0)
+
+    response.headers.add('Server-Timing', f'db;dur={db_stats["total_ms"]:.2f};desc="{db_stats["count"]} queries"')
+    response.headers.add('Server-Timing', f'serialize;dur={serialize_ms:.2f}')
+    if compress_ms:
+        response.headers.add('Server-Timing', f'compress;dur={compress_ms:.2f}')
+    response.headers.add('Server-Timing', f'app;dur={app_ms:.2f}')
+    response.headers.add('Server-Timing', f'total;dur={total_ms:.2f}')
+
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    request_metrics.observe(route, request.method, response.status_code, total_ms / 1000, db_stats, serialize_ms / 1000)
+    if db_stats['slowest_statement']:
+        app.logger.debug('%s %s: %d queries in %.2f ms, slowest %.2f ms: %s', request.method, route, db_stats['count'],
+                         db_stats['total_ms'], db_stats['slowest_ms'], db_stats['slowest_statement'])
+    return response
+
+
+@app.errorhandler(PoolExhausted)
+def handle_pool_exhausted(e):
+    return jsonify({'error': 'Database is busy, please try again'}), 503, {'Retry-After': '1'}
+
+
+def error_response(e, rollback=False):
+    # handlers answer their own failures with a 400, but an exhausted pool has to reach the 503 handler above
+    if isinstance(e, PoolExhausted):
+        raise e
+    if rollback:
+        mysql.connection.rollback()
+    return jsonify({'error': str(e)}), 400
+
+
+app.config['COMPRESS_RESPONSES'] = os.getenv('COMPRESS_RESPONSES', '1') == '1'
+app.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+app.config['COMPRESS_GZIP_LEVEL'] = int(os.getenv('COMPRESS_GZIP_LEVEL', 6))
+app.config['COMPRESS_BROTLI_QUALITY'] = int(os.getenv('COMPRESS_BROTLI_QUALITY', 4))
+
+COMPRESSIBLE_MIMETYPES = {'application/json', 'application/x-ndjson', 'text/csv', 'text/plain'}
+
+
+def compression_encodings():
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def compress_body(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=app.config['COMPRESS_BROTLI_QUALITY'])
+    return gzip.compress(body, compresslevel=app.config['COMPRESS_GZIP_LEVEL'], mtime=0)
+
+
+@app.after_request
+def compress_response(response):
+    if not app.config['COMPRESS_RESPONSES'] or response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    response.vary.add('Accept-Encoding')
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    encoding = request.accept_encodings.best_match(compression_encodings())
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < app.config['COMPRESS_MIN_SIZE']:
+        return response
+
+    started = time.perf_counter()
+    response.set_data(compress_body(body, encoding))
+    g.compress_ms = (time.perf_counter() - started) * 1000
+    response.headers['Content-Encoding'] = encoding
+    # each encoding is a different byte sequence, so it needs its own strong validator
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{encoding}', weak)
+    return response
+
+
+app.config['CATALOG_CACHE_MAX_ENTRIES'] = int(os.getenv('CATALOG_CACHE_MAX_ENTRIES', 1024))
+app.config['CATALOG_CACHE_TTL'] = float(os.getenv('CATALOG_CACHE_TTL', 60))
+
+
+class CatalogCache:
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                version, expires_at, value = entry
+                if version == self.version and expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value, version):
+        # version is read before querying MySQL so a write that lands mid-query is never cached
+        with self._lock:
+            if version != self.version:
+                return
+            self._entries[key] = (version, time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def sync(self, version):
+        with self._lock:
+            if version != self.version:
+                self.version = version
+                self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'version': self.version,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
+
+
+catalog_cache = CatalogCache(app.config['CATALOG_CACHE_MAX_ENTRIES'], app.config['CATALOG_CACHE_TTL'])
+
+app.config['CACHE_VERSION_REFRESH'] = float(os.getenv('CACHE_VERSION_REFRESH', 1))
+app.config['CATALOG_MAX_AGE'] = int(os.getenv('CATALOG_MAX_AGE', 60))
+
+
+class SharedVersion:
+    def __init__(self, name, refresh):
+        self.name = name
+        self.refresh = refresh
+        self.value = None
+        self.updated_at = None
+        self.read_at = 0.0
+        self._lock = threading.Lock()
+
+    def current(self):
+        # every worker re-reads the counter at most once per refresh interval, so revalidation rarely reaches MySQL
+        with self._lock:
+            if self.value is not None and time.monotonic() - self.read_at < self.refresh:
+                return self.value, self.updated_at
+        cur = mysql.connection.cursor()
+        cur.execute("""
+            SELECT admin_counters_value, UNIX_TIMESTAMP(admin_counters_updated_at)
+            FROM admin_counters
+            WHERE admin_counters_name = %s
+        """, (self.name,))
+        row = cur.fetchone()
+        cur.close()
+        return self.store(row)
+
+    def store(self, row):
+        value, updated_at = row if row else (0, None)
+        with self._lock:
+            self.value = value
+            self.updated_at = int(updated_at) if updated_at else None
+            self.read_at = time.monotonic()
+            return self.value, self.updated_at
+
+    def bump(self):
+        cur = mysql.connection.cursor()
+        try:
+            cur.execute("""
+                INSERT INTO admin_counters (admin_counters_name, admin_counters_value)
+                VALUES (%s, 1)
+                ON DUPLICATE KEY UPDATE admin_counters_value = admin_counters_value + 1
+            """, (self.name,))
+            cur.execute("""
+                SELECT admin_counters_value, UNIX_TIMESTAMP(admin_counters_updated_at)
+                FROM admin_counters
+                WHERE admin_counters_name = %s
+            """, (self.name,))
+            row = cur.fetchone()
+            mysql.connection.commit()
+        except Exception:
+            mysql.connection.rollback()
+            with self._lock:
+                self.value = None
+            app.logger.exception('Failed to bump the %s counter', self.name)
+            return None, None
+        finally:
+            cur.close()
+        return self.store(row)
+
+
+catalog_version = SharedVersion('catalog_version', app.config['CACHE_VERSION_REFRESH'])
+addresses_version = SharedVersion('addresses_version', app.config['CACHE_VERSION_REFRESH'])
+
+
+def current_catalog_version():
+    version, updated_at = catalog_version.current()
+    catalog_cache.sync(version)
+    return version, updated_at
+
+
+def bump_catalog():
+    version, updated_at = catalog_version.bump()
+    catalog_cache.sync(version)
+
+
+def set_validators(response, etag, last_modified, cache_control):
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def not_modified(etag, last_modified, cache_control):
+    # If-None-Match takes precedence; If-Modified-Since only has one-second resolution
+    if request.if_none_match:
+        variants = [etag] + [f'{etag}-{encoding}' for encoding in compression_encodings()]
+        matched = next((variant for variant in variants if request.if_none_match.contains(variant)), None)
+    else:
+        fresh = bool(request.if_modified_since and last_modified
+                     and last_modified <= request.if_modified_since.timestamp())
+        matched = etag if fresh else None
+    if matched is None:
+        return None
+    response = set_validators(Response(status=304), matched, last_modified, cache_control)
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+def catalog_cache_control():
+    return f"public, max-age={app.config['CATALOG_MAX_AGE']}"
+
+app.config['IMAGE_UPLOAD_URL'] = os.getenv('IMAGE_UPLOAD_URL', 'https://api.imgur.com/3/image')
+app.config['IMAGE_UPLOAD_CLIENT_ID'] = os.getenv('IMAGE_UPLOAD_CLIENT_ID', '3f7e2edaa33b9c8')
+app.config['IMAGE_UPLOAD_CONNECT_TIMEOUT'] = float(os.getenv('IMAGE_UPLOAD_CONNECT_TIMEOUT', 5))
+app.config['IMAGE_UPLOAD_READ_TIMEOUT'] = float(os.getenv('IMAGE_UPLOAD_READ_TIMEOUT', 30))
+app.config['IMAGE_UPLOAD_WORKERS'] = int(os.getenv('IMAGE_UPLOAD_WORKERS', 3))
+
+image_upload_session = requests.Session()
+image_upload_adapter = HTTPAdapter(pool_connections=1, pool_maxsize=app.config['IMAGE_UPLOAD_WORKERS'])
+image_upload_session.mount('https://', image_upload_adapter)
+image_upload_session.mount('http://', image_upload_adapter)
+image_upload_executor = ThreadPoolExecutor(max_workers=app.config['IMAGE_UPLOAD_WORKERS'], thread_name_prefix='image-upload')
+
+
+def upload_image_to_host(image_data):
+    headers = {'Authorization': f"Client-ID {app.config['IMAGE_UPLOAD_CLIENT_ID']}"}
+    timeout = (app.config['IMAGE_UPLOAD_CONNECT_TIMEOUT'], app.config['IMAGE_UPLOAD_READ_TIMEOUT'])
+    try:
+        response = image_upload_session.post(app.config['IMAGE_UPLOAD_URL'], headers=headers,
+                                             data={'image': base64.b64encode(image_data).decode('utf-8')}, timeout=timeout)
+    except requests.Timeout as e:
+        return None, (str(e), 504)
+    except requests.RequestException as e:
+        return None, (str(e), 502)
+
+    if response.status_code == 200:
+        return json.loads(response.text)['data']['link'], None
+    return None, (response.text, response.status_code)
+
+
+def upload_images_to_host(images_data):
+    return list(image_upload_executor.map(upload_image_to_host, images_data))
+
+
+app.config['IMAGE_UPLOAD_ASYNC'] = os.getenv('IMAGE_UPLOAD_ASYNC', '0') == '1'
+app.config['IMAGE_JOB_DIR'] = os.getenv('IMAGE_JOB_DIR', os.path.join(tempfile.gettempdir(), 'image_jobs'))
+app.config['IMAGE_JOB_WORKERS'] = int(os.getenv('IMAGE_JOB_WORKERS', 2))
+app.config['IMAGE_JOB_RETRIES'] = int(os.getenv('IMAGE_JOB_RETRIES', 3))
+app.config['IMAGE_JOB_BACKOFF'] = float(os.getenv('IMAGE_JOB_BACKOFF', 1))
+app.config['IMAGE_JOB_HISTORY'] = int(os.getenv('IMAGE_JOB_HISTORY', 1000))
+
+image_jobs = OrderedDict()
+image_jobs_lock = threading.Lock()
+image_job_queue = queue.Queue()
+image_job_workers = []
+
+
+def update_image_job(job_id, **fields):
+    with image_jobs_lock:
+        image_jobs[job_id].update(fields)
+
+
+def start_image_job_workers():
+    with image_jobs_lock:
+        # workers are started lazily so each gunicorn worker process gets its own threads after fork
+        if image_job_workers:
+            return
+        for i in range(app.config['IMAGE_JOB_WORKERS']):
+            worker = threading.Thread(target=run_image_job_worker, name=f'image-job-{i}', daemon=True)
+            worker.start()
+            image_job_workers.append(worker)
+
+
+def enqueue_image_job(products_id, images):
+    job_id = uuid.uuid4().hex
+    job_dir = os.path.join(app.config['IMAGE_JOB_DIR'], job_id)
+    os.makedirs(job_dir, exist_ok=True)
+
+    paths = []
+    for i, image_product in enumerate(images):
+        path = os.path.join(job_dir, f'image_product_{i}')
+        image_product.save(path)
+        paths.append(path)
+
+    with image_jobs_lock:
+        image_jobs[job_id] = {
+            'job_id': job_id,
+            'products_id': products_id,
+            'status': 'queued',
+            'attempts': 0,
+            'images': [],
+            'error': None
+        }
+        while len(image_jobs) > app.config['IMAGE_JOB_HISTORY']:
+            oldest_id, oldest = next(iter(image_jobs.items()))
+            if oldest['status'] not in ('done', 'failed'):
+                break
+            del image_jobs[oldest_id]
+
+    start_image_job_workers()
+    image_job_queue.put((job_id, products_id, job_dir, paths))
+    return job_id
+
+
+def process_image_job(job_id, products_id, paths):
+    pending = list(paths)
+    img_urls = []
+    error = None
+
+    for attempt in range(1, app.config['IMAGE_JOB_RETRIES'] + 1):
+        update_image_job(job_id, status='running', attempts=attempt)
+        images_data = []
+        for path in pending:
+            with open(path, 'rb') as image_file:
+                images_data.append(image_file.read())
+
+        failed = []
+        for path, (img_url, upload_error) in zip(pending, upload_images_to_host(images_data)):
+            if img_url:
+                img_urls.append(img_url)
+            else:
+                failed.append(path)
+                error = upload_error
+
+        pending = failed
+        if not pending:
+            break
+        if attempt < app.config['IMAGE_JOB_RETRIES']:
+            time.sleep(app.config['IMAGE_JOB_BACKOFF'] * 2 ** (attempt - 1))
+
+    if img_urls:
+        with app.app_context():
+            cursor = mysql.connection.cursor()
+            cursor.executemany("INSERT INTO images (images_url, images_products_id) VALUES (%s, %s)",
+                               [(img_url, products_id) for img_url in img_urls])
+            mysql.connection.commit()
+            cursor.close()
+            bump_catalog()
+
+    if pending:
+        update_image_job(job_id, status='failed', images=img_urls, error={'message': error[0], 'status': error[1]})
+    else:
+        update_image_job(job_id, status='done', images=img_urls)
+
+
+def run_image_job_worker():
+    while True:
+        job_id, products_id, job_dir, paths = image_job_queue.get()
+        try:
+            process_image_job(job_id, products_id, paths)
+        except Exception as e:
+            update_image_job(job_id, status='failed', error={'message': str(e), 'status': 500})
+        finally:
+            shutil.rmtree(job_dir, ignore_errors=True)
+            image_job_queue.task_done()
+
+
+app.config['BCRYPT_ROUNDS'] = int(os.getenv('BCRYPT_ROUNDS', 12))
+app.config['BCRYPT_POOL_SIZE'] = int(os.getenv('BCRYPT_POOL_SIZE', 2))
+app.config['BCRYPT_QUEUE_LIMIT'] = int(os.getenv('BCRYPT_QUEUE_LIMIT', 8))
+
+
+class HashPoolBusy(Exception):
+    pass
+
+
+class HashPool:
+    def __init__(self, size, queue_limit):
+        self.size = size
+        self.queue_limit = queue_limit
+        self.calls = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._latencies = deque(maxlen=1000)
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        # created on first use so each gunicorn worker gets its own pool; forkserver because by then
+        # request, upload and poller threads are running and forking a threaded process can deadlock the child
+        with self._lock:
+            if self._executor is None:
+                context = multiprocessing.get_context('forkserver')
+                context.set_forkserver_preload(['hashing'])
+                self._executor = ProcessPoolExecutor(max_workers=self.size, mp_context=context)
+            return self._executor
+
+    def _reset_executor(self, executor):
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def run(self, fn, *args):
+        with self._lock:
+            if self.in_flight >= self.queue_limit:
+                self.rejected += 1
+                raise HashPoolBusy()
+            self.in_flight += 1
+
+        started = time.perf_counter()
+        try:
+            executor = self._get_executor()
+            try:
+                return executor.submit(fn, *args).result()
+            except BrokenProcessPool:
+                self._reset_executor(executor)
+                raise
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self.in_flight -= 1
+                self.calls += 1
+                self.total_ms += elapsed_ms
+                self.max_ms = max(self.max_ms, elapsed_ms)
+                self._latencies.append(elapsed_ms)
+
+    def hashpw(self, password):
+        return self.run(hashing.bcrypt_hash, password.encode('utf-8'), app.config['BCRYPT_ROUNDS'])
+
+    def checkpw(self, password, hashed):
+        return self.run(hashing.bcrypt_check, password.encode('utf-8'), hashed.encode('utf-8'))
+
+    def stats(self):
+        with self._lock:
+            latencies = sorted(self._latencies)
+            return {
+                'size': self.size,
+                'queue_limit': self.queue_limit,
+                'rounds': app.config['BCRYPT_ROUNDS'],
+                'in_flight': self.in_flight,
+                'calls': self.calls,
+                'rejected': self.rejected,
+                'avg_ms': self.total_ms / self.calls if self.calls else 0.0,
+                'max_ms': self.max_ms,
+                'p50_ms': latencies[len(latencies) // 2] if latencies else 0.0,
+                'p95_ms': latencies[int(len(latencies) * 0.95)] if latencies else 0.0
+            }
+
+
+hash_pool = HashPool(app.config['BCRYPT_POOL_SIZE'], app.config['BCRYPT_QUEUE_LIMIT'])
+
+
+def password_needs_rehash(hashed):
+    try:
+        return int(hashed.split('$')[2]) != app.config['BCRYPT_ROUNDS']
+    except (IndexError, ValueError):
+        return False
+
+
+@app.errorhandler(HashPoolBusy)
+def handle_hash_pool_busy(e):
+    return jsonify({'error': 'Server is busy, please try again'}), 503, {'Retry-After': '1'}
+
+
+app.config['LOGIN_MAX_FAILURES_PER_EMAIL'] = int(os.getenv('LOGIN_MAX_FAILURES_PER_EMAIL', 5))
+app.config['LOGIN_MAX_FAILURES_PER_IP'] = int(os.getenv('LOGIN_MAX_FAILURES_PER_IP', 20))
+app.config['LOGIN_FAILURE_WINDOW'] = float(os.getenv('LOGIN_FAILURE_WINDOW', 300))
+app.config['LOGIN_THROTTLE_MAX_KEYS'] = int(os.getenv('LOGIN_THROTTLE_MAX_KEYS', 10000))
+
+
+class LoginThrottle:
+    def __init__(self, window, max_keys):
+        self.window = window
+        self.max_keys = max_keys
+        self._failures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _recent(self, key, now):
+        failures = self._failures.get(key)
+        if failures is None:
+            return None
+        while failures and failures[0] <= now - self.window:
+            failures.popleft()
+        if not failures:
+            del self._failures[key]
+            return None
+        return failures
+
+    def retry_after(self, limits):
+        now = time.monotonic()
+        with self._lock:
+            for key, limit in limits:
+                failures = self._recent(key, now)
+                if failures is not None and len(failures) >= limit:
+                    return max(1, int(failures[-limit] + self.window - now) + 1)
+        return 0
+
+    def record_failure(self, keys):
+        now = time.monotonic()
+        with self._lock:
+            for key in keys:
+                failures = self._recent(key, now)
+                if failures is None:
+                    failures = self._failures[key] = deque()
+                failures.append(now)
+                self._failures.move_to_end(key)
+            while len(self._failures) > self.max_keys:
+                self._failures.popitem(last=False)
+
+    def reset(self, key):
+        with self._lock:
+            self._failures.pop(key, None)
+
+
+login_throttle = LoginThrottle(app.config['LOGIN_FAILURE_WINDOW'], app.config['LOGIN_THROTTLE_MAX_KEYS'])
+
+ACCOUNT_TABLES = {
+    'USER': ('customers', 'customers_id', 'customers_password'),
+    'ADMIN': ('administrators', 'administrators_id', 'administrators_password')
+}
+
+
+app.config['UNSEEN_ORDERS_POLL_INTERVAL'] = float(os.getenv('UNSEEN_ORDERS_POLL_INTERVAL', 5))
+app.config['UNSEEN_ORDERS_MAX_WAIT'] = float(os.getenv('UNSEEN_ORDERS_MAX_WAIT', 30))
+app.config['UNSEEN_ORDERS_KEEPALIVE'] = float(os.getenv('UNSEEN_ORDERS_KEEPALIVE', 15))
+# every open stream or long-poll holds a gunicorn thread, so they get a fixed share of the thread budget
+app.config['UNSEEN_ORDERS_MAX_STREAMS'] = int(os.getenv('UNSEEN_ORDERS_MAX_STREAMS', 4))
+app.config['UNSEEN_ORDERS_MAX_WAITERS'] = int(os.getenv('UNSEEN_ORDERS_MAX_WAITERS', 4))
+app.config['UNSEEN_ORDERS_STREAM_MAX_AGE'] = float(os.getenv('UNSEEN_ORDERS_STREAM_MAX_AGE', 300))
+
+
+def read_unseen_orders():
+    with app.app_context():
+        cur = mysql.connection.cursor()
+        cur.execute("SELECT admin_counters_value FROM admin_counters WHERE admin_counters_name = 'unseen_orders'")
+        row = cur.fetchone()
+        cur.close()
+    return row[0] if row else 0
+
+
+class UnseenOrdersNotifier:
+    def __init__(self, poll_interval):
+        self.poll_interval = poll_interval
+        self.value = None
+        self.waiters = 0
+        self._condition = threading.Condition()
+        self._wakeup = threading.Event()
+        self._poller = None
+
+    def _poll(self):
+        # one poller per process reads the counter while anyone is waiting, however many tabs are open
+        while True:
+            with self._condition:
+                if not self.waiters:
+                    self._poller = None
+                    self.value = None
+                    return
+            try:
+                self.publish(read_unseen_orders())
+            except Exception:
+                app.logger.exception('Failed to read the unseen orders counter')
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def publish(self, value):
+        with self._condition:
+            if value != self.value:
+                self.value = value
+                self._condition.notify_all()
+
+    def refresh(self):
+        self._wakeup.set()
+
+    def wait_for_change(self, last_value, timeout):
+        deadline = time.monotonic() + timeout
+        with self._condition:
+            self.waiters += 1
+            if self._poller is None:
+                self._poller = threading.Thread(target=self._poll, name='unseen-orders-poller', daemon=True)
+                self._poller.start()
+            try:
+                while self.value is None or self.value == last_value:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                return self.value
+            finally:
+                self.waiters -= 1
+
+
+unseen_orders = UnseenOrdersNotifier(app.config['UNSEEN_ORDERS_POLL_INTERVAL'])
+unseen_stream_slots = threading.BoundedSemaphore(app.config['UNSEEN_ORDERS_MAX_STREAMS'])
+unseen_wait_slots = threading.BoundedSemaphore(app.config['UNSEEN_ORDERS_MAX_WAITERS'])
 
 
 @app.route('/<path:path>')
@@ -32,11 +1182,18 @@ def home():
     return jsonify({
         'message': {
             '/upload_image': 'Upload images for product (POST)',
-            '/products': 'Create new product (POST)',
-            '/products': 'Get all products o products by category (GET)',
+            '/upload_image?async=1': 'Queue images for background upload and return a job id (POST)',
+            '/upload_image/jobs/<string:job_id>': 'Get the status of a background image upload job (GET)',
+            'POST /products': 'Create new product (POST)',
+            '/products/import?partial=<bool>': 'Import products with image URLs from CSV or NDJSON, all or nothing unless partial (POST)',
+            'GET /products': 'Get all products o products by category (GET)',
+            '/products?after=<cursor>': 'Get the next page of products after a cursor, pass an empty cursor for the first page (GET)',
+            '/products?min_price=&max_price=&material=&in_stock=&sort=<newest|price_asc|price_desc>&facets=<bool>': 'Filter and sort products, optionally with category and material counts (GET)',
             '/product/<int:product_id>': 'Get a unique product by its id (GET)',
-            '/products/<int:product_id>': 'Updated the product by its id (PATCH)',
-            '/products/<int:product_id>': 'Delete the product by its id (DELETE)',
+            '/products/search?q=<string>&page=<int>': 'Search products by name, description and material, best matches first (GET)',
+            'PATCH /products/<int:product_id>': 'Updated the product by its id (PATCH)',
+            'PATCH /products': 'Update fields or adjust stock of many products in one transaction (PATCH)',
+            'DELETE /products/<int:product_id>': 'Delete the product by its id (DELETE)',
             '/customers': 'Create a new customer account (POST)',
             '/administrators': 'Create a new admin account (POST)',
             '/login': 'Log into the system (POST)',
@@ -48,8 +1205,8 @@ def home():
             '/administrators/verify_password': 'Verify password for admin (POST)',
             '/administrators/update_password': 'Update password for admin (PATCH)',
             '/administrators/<int:admin_id>': 'Delete account for admin  (DELETE)',
-            '/customers/<int:customer_id>': 'Delete account for customer (DELETE)',
-            '/customers/<int:customer_id>': 'Get data for customers (GET)',
+            'DELETE /customers/<int:customer_id>': 'Delete account for customer (DELETE)',
+            'GET /customers/<int:customer_id>': 'Get data for customers (GET)',
             '/customers/<int:customer_id>/addresses': 'Get all addresses for customer (GET)',
             '/addresses/<int:address_id>': 'Get address for customer by id (GET)',
             '/update_address': 'Update address for customer (PATCH)',
@@ -59,9 +1216,18 @@ def home():
             '/orders/user/<int:user_id>': 'Get all orders for customer (GET)',
             '/orders/user/number/<string:order_number>': 'Get order details for customer (GET)',
             '/orders/admin': 'Get all orders (GET)',
+            '/orders/admin?seen=<bool>': 'Get seen or unseen orders (GET)',
             '/orders/mark-seen/<string:order_number>': 'Update column seen for orders (PATCH)',
+            '/orders/admin/unseen?since=<int>&wait=<seconds>': 'Get the unseen orders counter, waiting for it to change from since (GET)',
+            '/orders/admin/unseen/stream': 'Stream unseen orders counter changes as Server-Sent Events (GET)',
             '/orders/admin/number/<string:order_number>': 'Get all orders (GET)',
             '/admin/customers': 'Get all customers (GET)',
+            '/admin/customers/export?format=<ndjson|csv>&from=<date>&to=<date>': 'Stream all customers, or customers with orders in the date range (GET)',
+            '/orders/admin/export?format=<ndjson|csv>&from=<date>&to=<date>&lines=<bool>': 'Stream all orders or order lines in the date range (GET)',
+            '/admin/cache/stats': 'Get hit/miss counters for the product catalog cache (GET)',
+            '/metrics': 'Prometheus metrics: per-route latency histograms, MySQL and serialization time, pool and cache gauges (GET)',
+            '/admin/db_pool/stats': 'Get checkout wait and saturation metrics for the MySQL connection pool (GET)',
+            '/admin/hash_pool/stats': 'Get latency and queue metrics for the password hashing pool (GET)',
             '/transactions': 'Save transactions in the database (POST)'
         }})
 
@@ -74,29 +1240,41 @@ def upload_image():
     if not products_id:
         return jsonify({"message": "Product ID is required"}), 400
 
-    CLIENT_ID = '3f7e2edaa33b9c8'
-    
-    for image_product in images:
-        if image_product:
-            image_data = base64.b64encode(image_product.read()).decode('utf-8')
-            image_product.seek(0)
+    if request.args.get('async', app.config['IMAGE_UPLOAD_ASYNC'], type=lambda value: value == '1'):
+        job_id = enqueue_image_job(products_id, [image_product for image_product in images if image_product])
+        return jsonify({"message": "Images queued for upload", "job_id": job_id}), 202
 
-            headers = {'Authorization': f'Client-ID {CLIENT_ID}'}
-            response = requests.post("https://api.imgur.com/3/image", headers=headers, data={'image': image_data})
+    images_data = [image_product.read() for image_product in images if image_product]
+    results = upload_images_to_host(images_data)
+    img_urls = [img_url for img_url, error in results if img_url]
 
-            if response.status_code == 200:
-                img_url = json.loads(response.text)['data']['link']
+    if img_urls:
+        cursor = mysql.connection.cursor()
+        cursor.executemany("INSERT INTO images (images_url, images_products_id) VALUES (%s, %s)",
+                           [(img_url, products_id) for img_url in img_urls])
+        mysql.connection.commit()
+        cursor.close()
+        bump_catalog()
 
-                cursor = mysql.connection.cursor()
-                cursor.execute("INSERT INTO images (images_url, images_products_id) VALUES (%s, %s)", (img_url, products_id))
-                mysql.connection.commit()
-                cursor.close()
-            else:
-                return jsonify({"message": "Image upload failed", "error": response.text}), response.status_code
+    for img_url, error in results:
+        if error:
+            return jsonify({"message": "Image upload failed", "error": error[0]}), error[1]
         
     return jsonify({"message": "Images uploaded successfully"}), 200
 
 
+@app.route('/upload_image/jobs/<string:job_id>', methods=['GET'])
+def get_image_job(job_id):
+    with image_jobs_lock:
+        job = image_jobs.get(job_id)
+        job = dict(job) if job else None
+
+    if job is None:
+        return jsonify({"message": "Job not found"}), 404
+
+    return jsonify({"job": job}), 200
+
+
 @app.route('/products', methods=['POST'])
 def add_product():
     data = request.form
@@ -106,111 +1284,635 @@ def add_product():
     mysql.connection.commit()
     products_id = cur.lastrowid  
     cur.close()
+    bump_catalog()
     
     return jsonify({'message': 'Product added', 'products_id': products_id}), 201
 
 
-@app.route('/products', methods=['GET'])
-def get_products():
-    category = request.args.get('category')
-    page = request.args.get('page', default=1, type=int) 
-    limit = 20  
-    offset = (page - 1) * limit 
-    cur = mysql.connection.cursor()
+app.config['IMPORT_BATCH_SIZE'] = int(os.getenv('IMPORT_BATCH_SIZE', 500))
+app.config['IMPORT_MAX_ERRORS'] = int(os.getenv('IMPORT_MAX_ERRORS', 1000))
+
+IMPORT_TEXT_FIELDS = ['products_name', 'products_category', 'products_description', 'products_material']
+IMPORT_FORMATS = {'text/csv': 'csv', 'application/x-ndjson': 'ndjson', 'application/jsonl': 'ndjson'}
+
+
+def request_lines():
+    # readline keeps memory flat; splitting on newline bytes never cuts a UTF-8 sequence
+    stream = request.stream
+    first = True
+    for raw in iter(stream.readline, b''):
+        line = raw.decode('utf-8')
+        if first:
+            line = line.lstrip('\ufeff')
+            first = False
+        yield line
+
+
+def import_records(import_format):
+    if import_format == 'csv':
+        reader = csv.DictReader(request_lines())
+        for record in reader:
+            yield reader.line_num, record, None
+        return
+    for line_number, line in enumerate(request_lines(), 1):
+        if not line.strip():
+            continue
+        try:
+            record = app.json.loads(line)
+        except ValueError:
+            yield line_number, None, ['line is not valid JSON']
+            continue
+        if not isinstance(record, dict):
+            yield line_number, None, ['line must be a JSON object']
+            continue
+        yield line_number, record, None
+
+
+def parse_quantity(value):
+    try:
+        quantity = int(str(value).strip())
+    except ValueError:
+        return None, 'products_quantity must be a whole number'
+    if quantity < 0:
+        return None, 'products_quantity must not be negative'
+    return quantity, None
 
-    query = """
-    SELECT p.products_id, p.products_name, p.products_category, p.products_description,
-           p.products_material, p.products_quantity, p.products_price,
-           p.products_price_discounted_10, p.products_price_discounted_20,
-           i.images_url
-    FROM products p
-    LEFT JOIN images i ON p.products_id = i.images_products_id
-    """
 
-    if category:
-        query += " WHERE p.products_category = %s ORDER BY p.products_id DESC LIMIT %s OFFSET %s"
-        cur.execute(query, (category, limit, offset))
-    else:
-        query += " ORDER BY p.products_id DESC LIMIT %s OFFSET %s"
-        cur.execute(query, (limit, offset))
+def parse_price(value):
+    try:
+        price = Decimal(str(value).strip())
+    except ArithmeticError:
+        return None, 'products_price must be a number'
+    if not price.is_finite() or price <= 0:
+        return None, 'products_price must be a positive number'
+    return price, None
+
+
+def validate_import_record(record):
+    errors = []
+    values = []
+    for field in IMPORT_TEXT_FIELDS:
+        value = record.get(field)
+        if not isinstance(value, str) or not value.strip():
+            errors.append(f'{field} is required')
+        values.append(value.strip() if isinstance(value, str) else None)
+
+    quantity, error = parse_quantity(record.get('products_quantity'))
+    if error:
+        errors.append(error)
+    price, error = parse_price(record.get('products_price'))
+    if error:
+        errors.append(error)
+    values += [quantity, price]
+
+    images = record.get('images') or []
+    if isinstance(images, str):
+        images = [image.strip() for image in images.split('|') if image.strip()]
+    if not isinstance(images, list) or not all(isinstance(image, str) and image.startswith(('http://', 'https://')) for image in images):
+        errors.append('images must be http(s) URLs')
+        images = []
+    return values, images, errors
+
+
+def insert_import_chunk(cur, chunk, step):
+    # one explicit multi-row statement per chunk: InnoDB hands a simple insert consecutive ids starting at lastrowid
+    placeholders = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(chunk))
+    cur.execute(f"""
+        INSERT INTO products (products_name, products_category, products_description, products_material, products_quantity, products_price)
+        VALUES {placeholders}
+    """, [value for values, images in chunk for value in values])
+    products_ids = [cur.lastrowid + index * step for index in range(len(chunk))]
+    image_rows = [(url, products_id) for (values, images), products_id in zip(chunk, products_ids) for url in images]
+    if image_rows:
+        cur.executemany("INSERT INTO images (images_url, images_products_id) VALUES (%s, %s)", image_rows)
+    return products_ids, len(image_rows)
+
+
+@app.route('/products/import', methods=['POST'])
+def import_products():
+    import_format = request.args.get('format') or IMPORT_FORMATS.get(request.mimetype)
+    if import_format not in ('csv', 'ndjson'):
+        return jsonify({'error': 'Send text/csv or application/x-ndjson, or pass format=csv|ndjson'}), 415
+    partial = request.args.get('partial', 'false').lower() in ('1', 'true')
+
+    products_ids = []
+    images_count = 0
+    errors = []
+    error_count = 0
+    chunk = []
+    try:
+        cur = mysql.connection.cursor()
+        cur.execute("SELECT @@session.auto_increment_increment")
+        step = cur.fetchone()[0]
+
+        for line_number, record, record_errors in import_records(import_format):
+            if record_errors is None:
+                values, images, record_errors = validate_import_record(record)
+            if record_errors:
+                error_count += 1
+                if len(errors) < app.config['IMPORT_MAX_ERRORS']:
+                    errors.append({'line': line_number, 'errors': record_errors})
+                continue
+            if error_count and not partial:
+                # the import will be rolled back anyway, keep validating without writing
+                continue
+            chunk.append((values, images))
+            if len(chunk) >= app.config['IMPORT_BATCH_SIZE']:
+                ids, count = insert_import_chunk(cur, chunk, step)
+                products_ids += ids
+                images_count += count
+                chunk = []
+
+        if error_count and not partial:
+            mysql.connection.rollback()
+            cur.close()
+            return jsonify({'error': 'Import rejected, nothing was saved', 'error_count': error_count, 'errors': errors}), 422
+
+        if chunk:
+            ids, count = insert_import_chunk(cur, chunk, step)
+            products_ids += ids
+            images_count += count
+        mysql.connection.commit()
+        cur.close()
+    except UnicodeDecodeError:
+        mysql.connection.rollback()
+        return jsonify({'error': 'Import must be UTF-8 encoded'}), 400
+    except csv.Error as e:
+        mysql.connection.rollback()
+        return jsonify({'error': f'Invalid CSV: {e}'}), 400
+    except Exception as e:
+        return error_response(e, rollback=True)
 
-    result = cur.fetchall()
-    cur.close()
+    if products_ids:
+        bump_catalog()
+    return jsonify({
+        'message': 'Products imported',
+        'imported': len(products_ids),
+        'products_ids': products_ids,
+        'images': images_count,
+        'error_count': error_count,
+        'errors': errors
+    }), 201
+
+
+PRODUCT_COLUMNS = """
+    products_id, products_name, products_category, products_description,
+    products_material, products_quantity, products_price,
+    products_price_discounted_10, products_price_discounted_20
+"""
+
+
+def product_from_row(row):
+    return {
+        'products_id': row[0],
+        'products_name': row[1],
+        'products_category': row[2],
+        'products_description': row[3],
+        'products_material': row[4],
+        'products_quantity': row[5],
+        'products_price': row[6],
+        'products_price_discounted_10': row[7],
+        'products_price_discounted_20': row[8],
+        'image_product': []
+    }
+
+
+def attach_product_images(cur, products):
+    if not products:
+        return
+    by_id = {product['products_id']: product for product in products}
+    placeholders = ", ".join(["%s"] * len(by_id))
+    cur.execute(f"""
+        SELECT images_products_id, images_url
+        FROM images
+        WHERE images_products_id IN ({placeholders})
+    """, tuple(by_id))
+    for products_id, images_url in cur.fetchall():
+        if images_url:
+            by_id[products_id]['image_product'].append(images_url)
+
+
+def encode_cursor(*values):
+    raw = ':'.join(str(value) for value in values)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('utf-8').rstrip('=')
+
+
+def decode_cursor(cursor, sort='newest'):
+    padded = cursor + '=' * (-len(cursor) % 4)
+    values = base64.urlsafe_b64decode(padded.encode('utf-8')).decode('utf-8').split(':')
+    if sort == 'newest':
+        products_id, = values
+        return (int(products_id),)
+    price, products_id = values
+    price = Decimal(price)
+    if not price.is_finite():
+        raise ValueError('cursor price must be finite')
+    return (price, int(products_id))
+
+
+# sort name -> (ORDER BY, keyset condition after the last row of the previous page)
+PRODUCT_SORTS = {
+    'newest': ("products_id DESC", "products_id < %s"),
+    'price_asc': ("products_price ASC, products_id ASC",
+                  "(products_price > %s OR (products_price = %s AND products_id > %s))"),
+    'price_desc': ("products_price DESC, products_id DESC",
+                   "(products_price < %s OR (products_price = %s AND products_id < %s))")
+}
+
+
+def product_filters(args):
+    conditions = []
+    params = []
+    for name, operator in (('min_price', '>='), ('max_price', '<=')):
+        if args.get(name):
+            price = Decimal(args[name])
+            # NaN and Infinity would reach MySQL as bare words
+            if not price.is_finite():
+                raise ArithmeticError(f'{name} must be finite')
+            conditions.append(f"products_price {operator} %s")
+            params.append(price)
+    if args.get('in_stock', '').lower() in ('1', 'true'):
+        conditions.append("products_quantity > 0")
+    category = args.get('category') or None
+    materials = sorted({material for value in args.getlist('material') for material in value.split(',') if material})
+    return conditions, params, category, materials
+
+
+def product_facets(conditions, params, category, materials, version):
+    # one grouped pass over category x material; both facets are summed from it, each ignoring its own filter
+    facets_key = ('facets', tuple(conditions), tuple(str(param) for param in params))
+    grid = catalog_cache.get(facets_key)
+    if grid is None:
+        where = " WHERE " + " AND ".join(conditions) if conditions else ""
+        cur = mysql.connection.cursor()
+        cur.execute(f"""
+            SELECT products_category, products_material, COUNT(*)
+            FROM products
+            {where}
+            GROUP BY products_category, products_material
+        """, params)
+        grid = cur.fetchall()
+        cur.close()
+        catalog_cache.set(facets_key, grid, version)
 
-    products = {}
-    for row in result:
-        product_id = row[0]
-        if product_id not in products:
-            products[product_id] = {
-                'products_id': row[0],
-                'products_name': row[1],
-                'products_category': row[2],
-                'products_description': row[3],
-                'products_material': row[4],
-                'products_quantity': row[5],
-                'products_price': row[6],
-                'products_price_discounted_10': row[7],
-                'products_price_discounted_20': row[8],
-                'image_product': []
-            }
+    categories = {}
+    material_counts = {}
+    for products_category, products_material, count in grid:
+        if not materials or products_material in materials:
+            categories[products_category] = categories.get(products_category, 0) + count
+        if not category or products_category == category:
+            material_counts[products_material] = material_counts.get(products_material, 0) + count
+    return {
+        'category': [{'value': value, 'count': count} for value, count in sorted(categories.items(), key=lambda item: -item[1])],
+        'material': [{'value': value, 'count': count} for value, count in sorted(material_counts.items(), key=lambda item: -item[1])]
+    }
 
-        if row[9] is not None:
-            products[product_id]['image_product'].append(row[9])
 
-    products_list = list(products.values())
+@app.route('/products', methods=['GET'])
+def get_products():
+    page = request.args.get('page', default=1, type=int) 
+    after = request.args.get('after')
+    sort = request.args.get('sort', 'newest')
+    with_facets = request.args.get('facets', '').lower() in ('1', 'true')
+    cursor_mode = after is not None
+    limit = 20  
+    offset = (page - 1) * limit 
 
-    cur = mysql.connection.cursor()
-    total_query = "SELECT COUNT(*) FROM products"
+    if sort not in PRODUCT_SORTS:
+        return jsonify({'error': f"sort must be one of {', '.join(PRODUCT_SORTS)}"}), 400
+    try:
+        filter_conditions, filter_params, category, materials = product_filters(request.args)
+    except ArithmeticError:
+        return jsonify({'error': 'min_price and max_price must be numbers'}), 400
+
+    after_key = None
+    if after:
+        try:
+            after_key = decode_cursor(after, sort)
+        except (ValueError, ArithmeticError):
+            return jsonify({'error': 'Invalid cursor'}), 400
+
+    version, updated_at = current_catalog_version()
+    etag = f'catalog-{version}'
+    cached = not_modified(etag, updated_at, catalog_cache_control())
+    if cached is not None:
+        return cached
+
+    conditions = list(filter_conditions)
+    params = list(filter_params)
     if category:
-        total_query += " WHERE products_category = %s"
-        cur.execute(total_query, (category,))
+        conditions.append("products_category = %s")
+        params.append(category)
+    if materials:
+        conditions.append(f"products_material IN ({', '.join(['%s'] * len(materials))})")
+        params.extend(materials)
+    filter_key = (tuple(conditions), tuple(str(param) for param in params))
+
+    page_key = ('products', filter_key, sort, after_key if cursor_mode else page)
+    products_list = catalog_cache.get(page_key)
+    if products_list is None:
+        order_by, keyset = PRODUCT_SORTS[sort]
+        page_conditions = list(conditions)
+        page_params = list(params)
+        if after_key is not None:
+            page_conditions.append(keyset)
+            page_params.extend(after_key if sort == 'newest' else (after_key[0], after_key[0], after_key[1]))
+
+        page_query = f"SELECT {PRODUCT_COLUMNS} FROM products"
+        if page_conditions:
+            page_query += " WHERE " + " AND ".join(page_conditions)
+        page_query += f" ORDER BY {order_by} LIMIT %s"
+        page_params.append(limit)
+        if not cursor_mode:
+            page_query += " OFFSET %s"
+            page_params.append(offset)
+
+        cur = mysql.connection.cursor()
+        cur.execute(page_query, page_params)
+        products_list = [product_from_row(row) for row in cur.fetchall()]
+        attach_product_images(cur, products_list)
+        cur.close()
+        catalog_cache.set(page_key, products_list, version)
+
+    if cursor_mode:
+        next_cursor = None
+        if len(products_list) == limit:
+            last = products_list[-1]
+            if sort == 'newest':
+                next_cursor = encode_cursor(last['products_id'])
+            else:
+                next_cursor = encode_cursor(last['products_price'], last['products_id'])
+        body = {'products': products_list, 'next_cursor': next_cursor}
     else:
-        cur.execute(total_query)
+        total_key = ('total', filter_key)
+        total_count = catalog_cache.get(total_key)
+        if total_count is None:
+            cur = mysql.connection.cursor()
+            total_query = "SELECT COUNT(*) FROM products"
+            if conditions:
+                total_query += " WHERE " + " AND ".join(conditions)
+            cur.execute(total_query, params)
+            total_count = cur.fetchone()[0]
+            cur.close()
+            catalog_cache.set(total_key, total_count, version)
+        body = {'products': products_list, 'total': total_count}
 
-    total_count = cur.fetchone()[0]
-    cur.close()
-    
-    return jsonify({'products': products_list, 'total': total_count})
+    if with_facets:
+        body['facets'] = product_facets(filter_conditions, filter_params, category, materials, version)
+    return set_validators(jsonify(body), etag, updated_at, catalog_cache_control())
 
 
 
 @app.route('/product/<int:product_id>', methods=['GET'])
 def get_product(product_id):
+    version, updated_at = current_catalog_version()
+    etag = f'catalog-{version}-product-{product_id}'
+    cached = not_modified(etag, updated_at, catalog_cache_control())
+    if cached is not None:
+        return cached
+
+    product_key = ('product', product_id)
+    product = catalog_cache.get(product_key)
+    if product is not None:
+        return set_validators(jsonify({'product': product}), etag, updated_at, catalog_cache_control())
+
     cur = mysql.connection.cursor()
-   
-    query = """
-        SELECT p.*, i.images_url 
-        FROM products p 
-        LEFT JOIN images i ON p.products_id = i.images_products_id 
-        WHERE p.products_id = %s
-    """
-    cur.execute(query, (product_id,))
-    rows = cur.fetchall()
+    cur.execute(f"SELECT {PRODUCT_COLUMNS} FROM products WHERE products_id = %s", (product_id,))
+    row = cur.fetchone()
+    product = product_from_row(row) if row else None
+    if product:
+        attach_product_images(cur, [product])
     cur.close()
     
-    if rows:
-        product = {
-            'products_id': rows[0][0],
-            'products_name': rows[0][1],
-            'products_category': rows[0][2],
-            'products_description': rows[0][3],
-            'products_material': rows[0][4],
-            'products_quantity': rows[0][5],
-            'products_price': rows[0][6],
-            'products_price_discounted_10': rows[0][7],
-            'products_price_discounted_20': rows[0][8],
-            'image_product': []
-        }
-        
-        for row in rows:
-            if row[9]:  
-                product['image_product'].append(row[9])
-        
-        return jsonify({'product': product})
+    if product:
+        catalog_cache.set(product_key, product, version)
+        return set_validators(jsonify({'product': product}), etag, updated_at, catalog_cache_control())
     
     return jsonify({'message': 'Product not found'}), 404
 
 
+app.config['SEARCH_MAX_TERMS'] = int(os.getenv('SEARCH_MAX_TERMS', 8))
+app.config['SEARCH_SNIPPET_LENGTH'] = int(os.getenv('SEARCH_SNIPPET_LENGTH', 160))
+
+app.config['SEARCH_MIN_TOKEN_SIZE'] = int(os.getenv('SEARCH_MIN_TOKEN_SIZE', 3))
+
+SEARCH_MATCH = "MATCH(products_name, products_description, products_material) AGAINST (%s IN BOOLEAN MODE)"
+
+# INFORMATION_SCHEMA.INNODB_FT_DEFAULT_STOPWORD, these are never indexed
+SEARCH_STOPWORDS = frozenset([
+    'a', 'about', 'an', 'are', 'as', 'at', 'be', 'by', 'com', 'de', 'en', 'for', 'from', 'how', 'i', 'in', 'is', 'it',
+    'la', 'of', 'on', 'or', 'that', 'the', 'this', 'to', 'was', 'what', 'when', 'where', 'who', 'will', 'with', 'und', 'www'
+])
+
+
+def search_terms(q):
+    # a required stopword or a word under innodb_ft_min_token_size would match nothing, so "blanket for baby" searches blanket baby
+    words = []
+    for word in re.findall(r'\w+', q.lower()):
+        if len(word) >= app.config['SEARCH_MIN_TOKEN_SIZE'] and word not in SEARCH_STOPWORDS and word not in words:
+            words.append(word)
+    return words[:app.config['SEARCH_MAX_TERMS']]
+
+
+def search_against(terms):
+    # every word is required and matches as a prefix, so "croch blank" finds "crocheted blanket"
+    return ' '.join(f'+{term}*' for term in terms)
+
+
+def highlight(text, pattern, length=None):
+    if not text:
+        return text
+    prefix = suffix = ''
+    if length and len(text) > length:
+        match = pattern.search(text)
+        start = max(0, match.start() - length // 4) if match else 0
+        prefix = '…' if start else ''
+        suffix = '…' if start + length < len(text) else ''
+        text = text[start:start + length]
+
+    # escape around the matches rather than matching escaped text, so terms never land inside an entity
+    parts = []
+    last = 0
+    for match in pattern.finditer(text):
+        parts.append(html.escape(text[last:match.start()]))
+        parts.append(f'<mark>{html.escape(match.group())}</mark>')
+        last = match.end()
+    parts.append(html.escape(text[last:]))
+    return prefix + ''.join(parts) + suffix
+
+
+@app.route('/products/search', methods=['GET'])
+def search_products():
+    terms = search_terms(request.args.get('q', ''))
+    if not terms:
+        return jsonify({'error': f"q must contain at least one word of {app.config['SEARCH_MIN_TOKEN_SIZE']} or more letters that is not a stopword"}), 400
+    page = max(request.args.get('page', default=1, type=int), 1)
+    limit = 20
+    offset = (page - 1) * limit
+
+    version, updated_at = current_catalog_version()
+    etag = f'catalog-{version}'
+    cached = not_modified(etag, updated_at, catalog_cache_control())
+    if cached is not None:
+        return cached
+
+    search_key = ('search', tuple(terms), page)
+    result = catalog_cache.get(search_key)
+    if result is None:
+        against = search_against(terms)
+        cur = mysql.connection.cursor()
+        cur.execute(f"""
+            SELECT {PRODUCT_COLUMNS}, {SEARCH_MATCH} AS score,
+                   (SELECT COUNT(*) FROM products WHERE {SEARCH_MATCH}) AS total
+            FROM products
+            WHERE {SEARCH_MATCH}
+            ORDER BY score DESC, products_id DESC
+            LIMIT %s OFFSET %s
+        """, (against, against, against, limit, offset))
+        rows = cur.fetchall()
+        products_list = [dict(product_from_row(row), score=round(float(row[9]), 4)) for row in rows]
+        attach_product_images(cur, products_list)
+        if rows:
+            total = rows[0][10]
+        else:
+            cur.execute(f"SELECT COUNT(*) FROM products WHERE {SEARCH_MATCH}", (against,))
+            total = cur.fetchone()[0]
+        cur.close()
+
+        pattern = re.compile(r'\b(?:' + '|'.join(re.escape(term) for term in terms) + r')\w*', re.IGNORECASE)
+        for product in products_list:
+            product['highlights'] = {
+                'products_name': highlight(product['products_name'], pattern),
+                'products_description': highlight(product['products_description'], pattern, app.config['SEARCH_SNIPPET_LENGTH']),
+                'products_material': highlight(product['products_material'], pattern)
+            }
+        result = {'products': products_list, 'total': total, 'page': page}
+        catalog_cache.set(search_key, result, version)
+
+    return set_validators(jsonify(result), etag, updated_at, catalog_cache_control())
+
+
+app.config['BATCH_UPDATE_MAX_ITEMS'] = int(os.getenv('BATCH_UPDATE_MAX_ITEMS', 1000))
+
+BATCH_UPDATE_COLUMNS = IMPORT_TEXT_FIELDS + ['products_quantity', 'products_price', 'stock_delta']
+
+
+def validate_batch_item(item, seen_ids):
+    if not isinstance(item, dict):
+        return None, ['item must be an object']
+    errors = []
+    products_id = item.get('products_id')
+    if not isinstance(products_id, int) or isinstance(products_id, bool) or products_id <= 0:
+        errors.append('products_id must be a positive integer')
+    elif products_id in seen_ids:
+        errors.append('products_id appears more than once')
+    else:
+        seen_ids.add(products_id)
+
+    fields = item.get('fields') or {}
+    if not isinstance(fields, dict):
+        return None, errors + ['fields must be an object']
+    values = dict.fromkeys(BATCH_UPDATE_COLUMNS)
+    for field, value in fields.items():
+        if field in IMPORT_TEXT_FIELDS:
+            if not isinstance(value, str) or not value.strip():
+                errors.append(f'{field} must be a non-empty string')
+            else:
+                values[field] = value.strip()
+        elif field == 'products_quantity':
+            values[field], error = parse_quantity(value)
+            if error:
+                errors.append(error)
+        elif field == 'products_price':
+            values[field], error = parse_price(value)
+            if error:
+                errors.append(error)
+        else:
+            errors.append(f'{field} cannot be updated')
+
+    stock_delta = item.get('stock_delta')
+    if stock_delta is not None:
+        if not isinstance(stock_delta, int) or isinstance(stock_delta, bool):
+            errors.append('stock_delta must be an integer')
+        elif values['products_quantity'] is not None:
+            errors.append('use either fields.products_quantity or stock_delta')
+        else:
+            values['stock_delta'] = stock_delta
+    if not fields and stock_delta is None:
+        errors.append('nothing to update')
+    return (products_id, values), errors
+
+
+@app.route('/products', methods=['PATCH'])
+def update_products():
+    data = request.get_json(silent=True)
+    items = data.get('items') if isinstance(data, dict) else data
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'Send a non-empty list of items'}), 400
+    if len(items) > app.config['BATCH_UPDATE_MAX_ITEMS']:
+        return jsonify({'error': f"At most {app.config['BATCH_UPDATE_MAX_ITEMS']} items per request"}), 400
+
+    updates = {}
+    item_errors = []
+    seen_ids = set()
+    for index, item in enumerate(items):
+        update, errors = validate_batch_item(item, seen_ids)
+        if errors:
+            item_errors.append({'index': index, 'products_id': item.get('products_id') if isinstance(item, dict) else None, 'errors': errors})
+        elif update:
+            updates[update[0]] = update[1]
+    if item_errors:
+        return jsonify({'error': 'Invalid items, nothing was updated', 'items': item_errors}), 400
+
+    cur = mysql.connection.cursor()
+    try:
+        # lock the rows first so stock deltas are checked against the values the update will see
+        placeholders = ", ".join(["%s"] * len(updates))
+        cur.execute(f"SELECT products_id, products_quantity FROM products WHERE products_id IN ({placeholders}) FOR UPDATE",
+                    tuple(updates))
+        current = dict(cur.fetchall())
+
+        quantities = {}
+        for index, (products_id, values) in enumerate(updates.items()):
+            if products_id not in current:
+                item_errors.append({'index': index, 'products_id': products_id, 'errors': ['Product not found']})
+                continue
+            quantity = values['products_quantity'] if values['products_quantity'] is not None else current[products_id]
+            quantities[products_id] = quantity + (values['stock_delta'] or 0)
+            if quantities[products_id] < 0:
+                item_errors.append({'index': index, 'products_id': products_id, 'available': current[products_id],
+                                    'errors': ['Insufficient stock']})
+        if item_errors:
+            mysql.connection.rollback()
+            cur.close()
+            return jsonify({'error': 'Some items cannot be applied, nothing was updated', 'items': item_errors}), 409
+
+        # one statement for the whole batch; NULL in the derived table keeps the current value
+        rows = [(products_id, *(values[column] for column in BATCH_UPDATE_COLUMNS)) for products_id, values in updates.items()]
+        changes_query, changes_params = derived_table(['products_id'] + BATCH_UPDATE_COLUMNS, rows)
+        cur.execute(f"""
+            UPDATE products p
+            JOIN ({changes_query}) d ON p.products_id = d.products_id
+            SET p.products_name = COALESCE(d.products_name, p.products_name),
+                p.products_category = COALESCE(d.products_category, p.products_category),
+                p.products_description = COALESCE(d.products_description, p.products_description),
+                p.products_material = COALESCE(d.products_material, p.products_material),
+                p.products_quantity = COALESCE(d.products_quantity, p.products_quantity) + COALESCE(d.stock_delta, 0),
+                p.products_price = COALESCE(d.products_price, p.products_price)
+        """, changes_params)
+        mysql.connection.commit()
+        cur.close()
+    except Exception as e:
+        return error_response(e, rollback=True)
+
+    bump_catalog()
+    return jsonify({
+        'message': 'Products updated',
+        'updated': len(updates),
+        'items': [{'products_id': products_id, 'products_quantity': quantity} for products_id, quantity in quantities.items()]
+    }), 200
+
+
 @app.route('/products/<int:product_id>', methods=['PATCH'])
 def update_product(product_id):
     data = request.form
@@ -236,32 +1938,36 @@ def update_product(product_id):
         update_query = ", ".join(update_fields)
         cur.execute(f"UPDATE products SET {update_query} WHERE products_id = %s", (*update_values, product_id))
         mysql.connection.commit()
+        bump_catalog()
 
     existing_images = []
     cur.execute("SELECT images_url FROM images WHERE images_products_id = %s", (product_id,))
     existing_images = cur.fetchall()
     existing_images_urls = {img[0] for img in existing_images}
 
-    for i in range(3):  
-        image_file = request.files.get(f'image_product_{i}')
-        if image_file:
-            if image_file.mimetype in ['image/jpeg', 'image/png']:
-                image_data = image_file.read()
-
-                CLIENT_ID = '3f7e2edaa33b9c8'
-                headers = {'Authorization': f'Client-ID {CLIENT_ID}'}
-                response = requests.post("https://api.imgur.com/3/image", headers=headers, files={'image': image_data})
+    image_files = [request.files.get(f'image_product_{i}') for i in range(3)]
+    image_files = [image_file for image_file in image_files if image_file]
+    for image_file in image_files:
+        if image_file.mimetype not in ['image/jpeg', 'image/png']:
+            cur.close()
+            return jsonify({"message": "Unsupported file type!"}), 400
+
+    results = upload_images_to_host([image_file.read() for image_file in image_files])
+    new_images_urls = []
+    for img_url, error in results:
+        if img_url and img_url not in existing_images_urls and img_url not in new_images_urls:
+            new_images_urls.append(img_url)
+
+    if new_images_urls:
+        cur.executemany("INSERT INTO images (images_url, images_products_id) VALUES (%s, %s)",
+                        [(img_url, product_id) for img_url in new_images_urls])
+        mysql.connection.commit()
+        bump_catalog()
 
-                if response.status_code == 200:
-                    img_url = json.loads(response.text)['data']['link']
-
-                    if img_url not in existing_images_urls:
-                        cur.execute("INSERT INTO images (images_url, images_products_id) VALUES (%s, %s)", (img_url, product_id))
-                        mysql.connection.commit()
-                else:
-                    return jsonify({"message": "Image upload failed", "error": response.text}), response.status_code
-            else:
-                return jsonify({"message": "Unsupported file type!"}), 400
+    for img_url, error in results:
+        if error:
+            cur.close()
+            return jsonify({"message": "Image upload failed", "error": error[0]}), error[1]
 
     cur.close()
     return jsonify({'message': 'Product updated'}), 200
@@ -274,6 +1980,7 @@ def delete_product(product_id):
     cur.execute("DELETE FROM products WHERE products_id = %s", (product_id,))
     mysql.connection.commit()
     cur.close()
+    bump_catalog()
 
     return jsonify({'message': 'Product deleted successfully'}), 200
 
@@ -287,7 +1994,7 @@ def add_customer():
     email = data['email']
     password = data['password']
 
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    hashed_password = hash_pool.hashpw(password)
     
     street_one = data['address']['street_one']
     street_two = data['address']['street_two']
@@ -314,10 +2021,11 @@ def add_customer():
 
         mysql.connection.commit()
         cur.close()
+        addresses_version.bump()
         
         return jsonify({'message': 'Customer added successfully', 'customer_id': customer_id}), 201
     except Exception as e:
-        return jsonify({'error': str(e)}), 400
+        return error_response(e)
 
 @app.route('/administrators', methods=['POST'])
 def add_administrator():
@@ -327,7 +2035,7 @@ def add_administrator():
     email = data['email']
     password = data['password']
 
-    hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    hashed_password = hash_pool.hashpw(password)
 
     try:
         cur = mysql.connection.cursor()
@@ -344,7 +2052,7 @@ def add_administrator():
 
         return jsonify({'message': 'Administrator added successfully', 'admin_id': admin_id}), 201
     except Exception as e:
-        return jsonify({'error': str(e)}), 400
+        return error_response(e)
     
 
 @app.route('/login', methods=['POST'])
@@ -353,27 +2061,49 @@ def login():
     email = data.get('email')
     password = data.get('password')
 
-    cur = mysql.connection.cursor()
-    cur.execute('SELECT * FROM customers WHERE customers_email = %s', (email,))
-    customer = cur.fetchone()
-
-    if customer and bcrypt.checkpw(password.encode('utf-8'), customer[4].encode('utf-8')):  
-        return jsonify({
-            'role': 'USER',
-            'first_name': customer[1],  
-            'id': customer[0]         
-        }), 200
-
-    cur.execute('SELECT * FROM administrators WHERE administrators_email = %s', (email,))
-    admin = cur.fetchone()
+    email_key = ('email', (email or '').strip().lower())
+    ip_key = ('ip', request.remote_addr)
+    retry_after = login_throttle.retry_after([
+        (email_key, app.config['LOGIN_MAX_FAILURES_PER_EMAIL']),
+        (ip_key, app.config['LOGIN_MAX_FAILURES_PER_IP'])
+    ])
+    if retry_after:
+        return jsonify({'error': 'Too many failed login attempts'}), 429, {'Retry-After': str(retry_after)}
 
-    if admin and bcrypt.checkpw(password.encode('utf-8'), admin[4].encode('utf-8')):  
-        return jsonify({
-            'role': 'ADMIN',
-            'first_name': admin[1],     
-            'id': admin[0]              
-        }), 200
+    cur = mysql.connection.cursor()
+    cur.execute("""
+        SELECT customers_id, customers_first_name, customers_password, 'USER'
+        FROM customers
+        WHERE customers_email = %s
+        UNION ALL
+        SELECT administrators_id, administrators_first_name, administrators_password, 'ADMIN'
+        FROM administrators
+        WHERE administrators_email = %s
+    """, (email, email))
+    accounts = cur.fetchall()
+
+    for account_id, first_name, password_hash, role in accounts:
+        if password and hash_pool.checkpw(password, password_hash):
+            if password_needs_rehash(password_hash):
+                # the upgrade is best effort: when the pool is saturated the login still succeeds and the next one retries it
+                try:
+                    new_hash = hash_pool.hashpw(password)
+                except HashPoolBusy:
+                    new_hash = None
+                if new_hash:
+                    table, id_column, password_column = ACCOUNT_TABLES[role]
+                    cur.execute(f'UPDATE {table} SET {password_column} = %s WHERE {id_column} = %s', (new_hash, account_id))
+                    mysql.connection.commit()
+            cur.close()
+            login_throttle.reset(email_key)
+            return jsonify({
+                'role': role,
+                'first_name': first_name,
+                'id': account_id
+            }), 200
 
+    cur.close()
+    login_throttle.record_failure([email_key, ip_key])
     return jsonify({'error': 'Invalid login credentials'}), 401
 
 @app.route('/customers/update_email', methods=['PATCH'])
@@ -404,8 +2134,7 @@ def update_customer_email():
         return jsonify({'message': 'Customer email updated successfully!'}), 200
 
     except Exception as e:
-        mysql.connection.rollback()
-        return jsonify({'error': str(e)}), 400
+        return error_response(e, rollback=True)
     
 @app.route('/customers/verify_password', methods=['POST'])
 def verify_customer_password():
@@ -426,7 +2155,7 @@ def verify_customer_password():
 
     stored_password_hash = user[0]
     
-    if bcrypt.checkpw(entered_password.encode('utf-8'), stored_password_hash.encode('utf-8')):
+    if hash_pool.checkpw(entered_password, stored_password_hash):
         return jsonify({'isValid': True}), 200
     else:
         return jsonify({'isValid': False, 'message': 'Invalid password.'}), 401
@@ -441,9 +2170,9 @@ def update_customer_password():
     if not customer_id or not password:
         return jsonify({'error': 'Missing customers_id or customers_password'}), 400
 
-    try:
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    hashed_password = hash_pool.hashpw(password)
 
+    try:
         cur = mysql.connection.cursor()
         
         cur.execute("""
@@ -461,8 +2190,7 @@ def update_customer_password():
         return jsonify({'message': 'Customer password updated successfully!'}), 200
 
     except Exception as e:
-        mysql.connection.rollback()
-        return jsonify({'error': str(e)}), 400
+        return error_response(e, rollback=True)
     
 @app.route('/customers/update_phone', methods=['PATCH'])
 def update_customer_phone():
@@ -492,8 +2220,7 @@ def update_customer_phone():
         return jsonify({'message': 'Customer phone number updated successfully!'}), 200
 
     except Exception as e:
-        mysql.connection.rollback()
-        return jsonify({'error': str(e)}), 400
+        return error_response(e, rollback=True)
     
 @app.route('/administrators/update_email', methods=['PATCH'])
 def update_administrator_email():
@@ -523,8 +2250,7 @@ def update_administrator_email():
         return jsonify({'message': 'Administrator email updated successfully!'}), 200
 
     except Exception as e:
-        mysql.connection.rollback()
-        return jsonify({'error': str(e)}), 400
+        return error_response(e, rollback=True)
 
 @app.route('/administrators/verify_password', methods=['POST'])
 def verify_administrator_password():
@@ -545,7 +2271,7 @@ def verify_administrator_password():
 
     stored_password_hash = user[0]
     
-    if bcrypt.checkpw(entered_password.encode('utf-8'), stored_password_hash.encode('utf-8')):
+    if hash_pool.checkpw(entered_password, stored_password_hash):
         return jsonify({'isValid': True}), 200
     else:
         return jsonify({'isValid': False, 'message': 'Invalid password.'}), 401
@@ -560,9 +2286,9 @@ def update_administrator_password():
     if not administrator_id or not password:
         return jsonify({'error': 'Missing administrators_id or administrators_password'}), 400
 
-    try:
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+    hashed_password = hash_pool.hashpw(password)
 
+    try:
         cur = mysql.connection.cursor()
         
         cur.execute("""
@@ -580,8 +2306,7 @@ def update_administrator_password():
         return jsonify({'message': 'Administrator password updated successfully!'}), 200
 
     except Exception as e:
-        mysql.connection.rollback()
-        return jsonify({'error': str(e)}), 400
+        return error_response(e, rollback=True)
 
 @app.route('/administrators/<int:admin_id>', methods=['DELETE'])
 def delete_administrator(admin_id):
@@ -595,8 +2320,7 @@ def delete_administrator(admin_id):
         return jsonify({'message': 'Administrator deleted successfully!'}), 200
 
     except Exception as e:
-        mysql.connection.rollback()
-        return jsonify({'error': str(e)}), 400
+        return error_response(e, rollback=True)
 
 @app.route('/customers/<int:customer_id>', methods=['DELETE'])
 def delete_customer(customer_id):
@@ -606,12 +2330,12 @@ def delete_customer(customer_id):
         cur.execute('DELETE FROM customers WHERE customers_id = %s', (customer_id,))
         mysql.connection.commit()
         cur.close()
+        addresses_version.bump()
         
         return jsonify({'message': 'Customer deleted successfully!'}), 200
 
     except Exception as e:
-        mysql.connection.rollback()
-        return jsonify({'error': str(e)}), 400
+        return error_response(e, rollback=True)
     
 
 @app.route('/customers/<int:customer_id>', methods=['GET'])
@@ -646,6 +2370,12 @@ def get_customer(customer_id):
 @app.route('/customers/<int:customer_id>/addresses', methods=['GET'])
 def get_addresses(customer_id):
     try:
+        version, updated_at = addresses_version.current()
+        etag = f'addresses-{version}-customer-{customer_id}'
+        cached = not_modified(etag, updated_at, 'private, no-cache')
+        if cached is not None:
+            return cached
+
         cur = mysql.connection.cursor()
         cur.execute("SELECT * FROM addresses WHERE addresses_customers_id = %s", (customer_id,))
         addresses = cur.fetchall()
@@ -664,10 +2394,10 @@ def get_addresses(customer_id):
                 'customer_id': address[7],
             })
 
-        return jsonify({'addresses': address_list}), 200
+        return set_validators(jsonify({'addresses': address_list}), etag, updated_at, 'private, no-cache'), 200
 
     except Exception as e:
-        return jsonify({'error': str(e)}), 400
+        return error_response(e)
 
 @app.route('/addresses/<int:address_id>', methods=['GET'])
 def get_address(address_id):
@@ -692,7 +2422,7 @@ def get_address(address_id):
             return jsonify({'error': 'Address not found'}), 404
 
     except Exception as e:
-        return jsonify({'error': str(e)}), 400
+        return error_response(e)
 
 
 @app.route('/update_address', methods=['PATCH'])
@@ -721,12 +2451,12 @@ def update_address():
         mysql.connection.commit()
         
         cur.close()
+        addresses_version.bump()
         
         return jsonify({'message': 'Address updated successfully!'}), 200
 
     except Exception as e:
-        mysql.connection.rollback()
-        return jsonify({'error': str(e)}), 400
+        return error_response(e, rollback=True)
 
 
 @app.route('/add_address', methods=['POST'])
@@ -754,12 +2484,12 @@ def add_address():
 
         mysql.connection.commit()
         cur.close()
+        addresses_version.bump()
         
         return jsonify({'message': 'Address added successfully!'}), 201
 
     except Exception as e:
-        mysql.connection.rollback()
-        return jsonify({'error': str(e)}), 400
+        return error_response(e, rollback=True)
     
 @app.route('/delete_address/<int:address_id>', methods=['DELETE'])
 def delete_address(address_id):
@@ -773,12 +2503,19 @@ def delete_address(address_id):
 
         mysql.connection.commit()
         cur.close()
+        addresses_version.bump()
         
         return jsonify({'message': 'Address deleted successfully!'}), 200
 
     except Exception as e:
-        mysql.connection.rollback()
-        return jsonify({'error': str(e)}), 400
+        return error_response(e, rollback=True)
+
+
+def derived_table(columns, rows):
+    first = "SELECT " + ", ".join(f"%s AS {column}" for column in columns)
+    rest = "SELECT " + ", ".join(["%s"] * len(columns))
+    query = " UNION ALL ".join([first] + [rest] * (len(rows) - 1))
+    return query, [value for row in rows for value in row]
 
 
 @app.route('/orders', methods=['POST'])
@@ -792,25 +2529,103 @@ def create_order():
     orders_total_price = data['orders_total_price']
     orders_transactions_id = data['orders_transactions_id']
 
+    try:
+        lines = [(int(product_id), int(quantity)) for product_id, quantity in zip(orders_products_id, orders_product_quantity)]
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Product ids and quantities must be integers'}), 400
+
+    if not lines or any(quantity <= 0 for product_id, quantity in lines):
+        return jsonify({'error': 'Order must contain at least one line with a positive quantity'}), 400
+
+    requested = OrderedDict()
+    for product_id, quantity in lines:
+        requested[product_id] = requested.get(product_id, 0) + quantity
+
     cur = mysql.connection.cursor()
 
-    for product_id, quantity in zip(orders_products_id, orders_product_quantity):
+    try:
         cur.execute("""
+            INSERT INTO order_headers (order_headers_number, order_headers_customers_id, order_headers_addresses_id, order_headers_transactions_id, order_headers_total_price, order_headers_date, order_headers_seen)
+            VALUES (%s, %s, %s, %s, %s, NOW(), %s)
+        """, (orders_number, orders_customers_id, orders_addresses_id, orders_transactions_id, orders_total_price, 0))
+
+        stock_query, stock_params = derived_table(('products_id', 'quantity'), list(requested.items()))
+        cur.execute(f"""
+            UPDATE products p
+            JOIN ({stock_query}) d ON p.products_id = d.products_id
+            SET p.products_quantity = p.products_quantity - d.quantity
+            WHERE p.products_quantity >= d.quantity
+        """, stock_params)
+
+        if cur.rowcount != len(requested):
+            mysql.connection.rollback()
+            placeholders = ", ".join(["%s"] * len(requested))
+            cur.execute(f"SELECT products_id, products_quantity FROM products WHERE products_id IN ({placeholders})", tuple(requested))
+            available = dict(cur.fetchall())
+            cur.close()
+
+            stock_errors = []
+            for line, (product_id, quantity) in enumerate(lines):
+                if product_id not in available:
+                    stock_errors.append({'line': line, 'products_id': product_id, 'requested': quantity, 'available': 0, 'error': 'Product not found'})
+                elif available[product_id] < requested[product_id]:
+                    stock_errors.append({'line': line, 'products_id': product_id, 'requested': quantity, 'available': available[product_id], 'error': 'Insufficient stock'})
+            return jsonify({'error': 'Insufficient stock', 'lines': stock_errors}), 409
+
+        # one multi-row statement; executemany would run once per line because of NOW()
+        line_values = ", ".join(["(%s, %s, %s, %s, %s, %s, %s, NOW(), %s)"] * len(lines))
+        cur.execute(f"""
             INSERT INTO orders (orders_number, orders_products_id, orders_product_quantity, orders_customers_id, orders_addresses_id, orders_total_price, orders_transactions_id, orders_date, orders_seen)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, NOW(), %s)
-        """, (orders_number, product_id, quantity, orders_customers_id, orders_addresses_id, orders_total_price, orders_transactions_id, 0))
+            VALUES {line_values}
+        """, [value for product_id, quantity in lines
+              for value in (orders_number, product_id, quantity, orders_customers_id, orders_addresses_id, orders_total_price, orders_transactions_id, 0)])
 
         cur.execute("""
-            UPDATE products 
-            SET products_quantity = products_quantity - %s 
-            WHERE products_id = %s
-        """, (quantity, product_id))
+            INSERT INTO customer_stats (customer_stats_customers_id, customer_stats_order_count, customer_stats_total_spent)
+            VALUES (%s, 1, %s)
+            ON DUPLICATE KEY UPDATE
+                customer_stats_order_count = customer_stats_order_count + 1,
+                customer_stats_total_spent = customer_stats_total_spent + VALUES(customer_stats_total_spent)
+        """, (orders_customers_id, orders_total_price))
 
-    mysql.connection.commit()
-    cur.close()
+        cur.execute("""
+            UPDATE admin_counters
+            SET admin_counters_value = admin_counters_value + 1
+            WHERE admin_counters_name = 'unseen_orders'
+        """)
+
+        mysql.connection.commit()
+        cur.close()
+    except Exception as e:
+        return error_response(e, rollback=True)
+
+    bump_catalog()
+    unseen_orders.refresh()
     
     return jsonify({'message': 'Order created successfully!'}), 201
 
+def fetch_order_headers(where, params, per_page, offset):
+    cur = mysql.connection.cursor()
+    cur.execute(f"""
+        SELECT order_headers_number, order_headers_total_price, order_headers_date, order_headers_seen,
+               (SELECT COUNT(*) FROM order_headers {where}) AS total
+        FROM order_headers
+        {where}
+        ORDER BY order_headers_date DESC
+        LIMIT %s OFFSET %s
+    """, (*params, *params, per_page, offset))
+    orders = cur.fetchall()
+
+    if orders:
+        total = orders[0][4]
+    else:
+        cur.execute(f"SELECT COUNT(*) FROM order_headers {where}", params)
+        total = cur.fetchone()[0]
+    cur.close()
+
+    return orders, total
+
+
 @app.route('/orders/user/<int:user_id>', methods=['GET'])
 def get_user_orders(user_id):
     try:
@@ -818,99 +2633,74 @@ def get_user_orders(user_id):
         per_page = 15
         offset = (page - 1) * per_page
 
-        cur = mysql.connection.cursor()
-        query = """
-            SELECT 
-                orders_number, 
-                orders_total_price, 
-                orders_date
-            FROM 
-                orders
-            WHERE 
-                orders_customers_id = %s
-            GROUP BY 
-                orders_number, orders_total_price, orders_date
-            ORDER BY 
-                orders_date DESC
-            LIMIT %s OFFSET %s
-        """
-        cur.execute(query, (user_id, per_page, offset))
-        orders = cur.fetchall()
-        cur.close()
-
-        cur = mysql.connection.cursor()
-        cur.execute("SELECT COUNT(DISTINCT orders_number) FROM orders WHERE orders_customers_id = %s", (user_id,))
-        total = cur.fetchone()[0]
-        cur.close()
+        orders, total = fetch_order_headers("WHERE order_headers_customers_id = %s", (user_id,), per_page, offset)
 
         return jsonify({
             'orders': [{
                 'order_number': order[0],
                 'total_price': order[1],
-                'date': order[2].isoformat()
+                'date': order[2]
             } for order in orders],
             'total': total
         }), 200
 
     except Exception as e:
-        return jsonify({'error': str(e)}), 400
+        return error_response(e)
+
+
+ORDER_DETAILS_QUERY = """
+    SELECT o.orders_total_price, o.orders_customers_id, o.orders_transactions_id,
+           a.addresses_id, a.addresses_street_one, a.addresses_street_two, a.addresses_city,
+           a.addresses_province, a.addresses_country, a.addresses_postal_code,
+           p.products_id, p.products_name, p.products_price, o.orders_product_quantity
+           {extra_columns}
+    FROM orders o
+    LEFT JOIN addresses a ON a.addresses_id = o.orders_addresses_id
+    LEFT JOIN products p ON p.products_id = o.orders_products_id
+    {extra_joins}
+    WHERE o.orders_number = %s
+    ORDER BY o.orders_id
+"""
+
+
+def order_details_from_rows(order_number, rows):
+    first = rows[0]
+    return {
+        'order_number': order_number,
+        'total_price': first[0],
+        'address': {
+            'id': first[3],
+            'street_one': first[4],
+            'street_two': first[5],
+            'city': first[6],
+            'province': first[7],
+            'country': first[8],
+            'postal_code': first[9]
+        },
+        'products': [{
+            'id': row[10],
+            'name': row[11],
+            'price': row[12],
+            'quantity': row[13]
+        } for row in rows if row[10] is not None]
+    }
 
 
 @app.route('/orders/user/number/<string:order_number>', methods=['GET'])
 def get_order_details_by_number(order_number):
     try:
         cur = mysql.connection.cursor()
+        cur.execute(ORDER_DETAILS_QUERY.format(extra_columns='', extra_joins=''), (order_number,))
+        rows = cur.fetchall()
+        cur.close()
         
-        cur.execute("""
-            SELECT orders_id, orders_total_price, orders_addresses_id
-            FROM orders
-            WHERE orders_number = %s
-        """, (order_number,))
-        orders = cur.fetchall()
-        
-        if not orders:
+        if not rows:
             return jsonify({'error': 'Order not found'}), 404
         
-        address_id = orders[0][2]
-        
-        cur.execute("SELECT * FROM addresses WHERE addresses_id = %s", (address_id,))
-        address = cur.fetchone()
-        
-        products = []
-        for order in orders:
-            order_id = order[0]
-            cur.execute("""
-                SELECT products.products_id, products.products_name, products.products_price, orders.orders_product_quantity
-                FROM products
-                JOIN orders ON products.products_id = orders.orders_products_id
-                WHERE orders.orders_id = %s
-            """, (order_id,))
-            products.extend(cur.fetchall())
-        
-        cur.close()
-        
-        return jsonify({
-            'order_number': order_number,
-            'total_price': orders[0][1],  
-            'address': {
-                'id': address[0],
-                'street_one': address[1],
-                'street_two': address[2],
-                'city': address[3],
-                'province': address[4],
-                'country': address[5],
-                'postal_code': address[6]
-            },
-            'products': [{
-                'id': product[0],
-                'name': product[1],
-                'price': product[2],
-                'quantity': product[3]
-            } for product in products]
-        }), 200
+        return jsonify(order_details_from_rows(order_number, rows)), 200
 
     except Exception as e:
-        return jsonify({'error': str(e)}), 400
+        return error_response(e)
     
 
 @app.route('/orders/admin', methods=['GET'])
@@ -919,37 +2709,27 @@ def get_all_orders():
         page = request.args.get('page', 1, type=int)  
         per_page = 15  
         offset = (page - 1) * per_page  
+        seen = request.args.get('seen')
 
-        cur = mysql.connection.cursor()
-        cur.execute(f"""
-            SELECT orders_number, orders_total_price, orders_date, orders_seen
-            FROM orders
-            GROUP BY orders_number, orders_total_price, orders_date, orders_seen
-            ORDER BY orders_date DESC
-            LIMIT {per_page} OFFSET {offset}
-        """)
-        orders = cur.fetchall()
-        cur.close()
-
-        cur = mysql.connection.cursor()
-        cur.execute("SELECT COUNT(DISTINCT orders_number) FROM orders")
-        total = cur.fetchone()[0]
-        cur.close()
+        if seen is None:
+            orders, total = fetch_order_headers("", (), per_page, offset)
+        elif seen.lower() in ('1', 'true', '0', 'false'):
+            orders, total = fetch_order_headers("WHERE order_headers_seen = %s", (int(seen.lower() in ('1', 'true')),), per_page, offset)
+        else:
+            return jsonify({'error': 'seen must be true or false'}), 400
 
         return jsonify({
             'orders': [{
                 'order_number': order[0],
                 'total_price': order[1],
-                'date': order[2].isoformat(),
+                'date': order[2],
                 'seen': order[3]
             } for order in orders],
             'total': total
         }), 200
 
     except Exception as e:
-        return jsonify({'error': str(e)}), 400
-
-
+        return error_response(e)
 
 
 @app.route('/orders/mark-seen/<string:order_number>', methods=['PATCH'])
@@ -961,86 +2741,116 @@ def mark_order_as_seen(order_number):
             SET orders_seen = TRUE  # Виправлено на orders_seen
             WHERE orders_number = %s
         """, (order_number,))
+        cur.execute("""
+            UPDATE order_headers
+            SET order_headers_seen = TRUE
+            WHERE order_headers_number = %s AND order_headers_seen = FALSE
+        """, (order_number,))
+        if cur.rowcount:
+            cur.execute("""
+                UPDATE admin_counters
+                SET admin_counters_value = admin_counters_value - 1
+                WHERE admin_counters_name = 'unseen_orders'
+            """)
         mysql.connection.commit()
         cur.close()
+        unseen_orders.refresh()
         return jsonify({'message': 'Order marked as seen'}), 200
     except Exception as e:
-        return jsonify({'error': str(e)}), 400
+        return error_response(e)
+
+
+@app.route('/orders/admin/unseen', methods=['GET'])
+def get_unseen_orders():
+    since = request.args.get('since', type=int)
+    if since is None:
+        return jsonify({'unseen': read_unseen_orders()}), 200
+
+    retry_after = {'Retry-After': str(int(app.config['UNSEEN_ORDERS_POLL_INTERVAL']))}
+    if not unseen_wait_slots.acquire(blocking=False):
+        # all long-poll slots are taken: answer right away and let the client poll again later
+        value = read_unseen_orders()
+        if value == since:
+            return '', 204, retry_after
+        return jsonify({'unseen': value}), 200, retry_after
+
+    try:
+        wait = min(request.args.get('wait', app.config['UNSEEN_ORDERS_MAX_WAIT'], type=float), app.config['UNSEEN_ORDERS_MAX_WAIT'])
+        value = unseen_orders.wait_for_change(since, wait)
+    finally:
+        unseen_wait_slots.release()
+    if value is None or value == since:
+        return '', 204
+    return jsonify({'unseen': value}), 200
+
+
+@app.route('/orders/admin/unseen/stream', methods=['GET'])
+def stream_unseen_orders():
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    retry = f"retry: {int(app.config['UNSEEN_ORDERS_POLL_INTERVAL'] * 1000)}\n"
+
+    if not unseen_stream_slots.acquire(blocking=False):
+        # no stream slot left: send the current value and close, EventSource reconnects after the retry delay
+        event = f"event: unseen\ndata: {json.dumps({'unseen': read_unseen_orders()})}\n\n"
+        return Response(retry + event, mimetype='text/event-stream', headers=headers)
+
+    def events():
+        deadline = time.monotonic() + app.config['UNSEEN_ORDERS_STREAM_MAX_AGE']
+        last_value = None
+        yield retry + "\n"
+        # streams are recycled so a slot is never held by one tab forever
+        while time.monotonic() < deadline:
+            value = unseen_orders.wait_for_change(last_value, app.config['UNSEEN_ORDERS_KEEPALIVE'])
+            if value is not None and value != last_value:
+                last_value = value
+                yield f"event: unseen\ndata: {json.dumps({'unseen': value})}\n\n"
+            else:
+                yield ": keepalive\n\n"
+
+    response = Response(events(), mimetype='text/event-stream', headers=headers)
+    response.call_on_close(unseen_stream_slots.release)
+    return response
 
 
 @app.route('/orders/admin/number/<string:order_number>', methods=['GET'])
 def get_order_details_by_number_for_admin(order_number):
     try:
         cur = mysql.connection.cursor()
+        cur.execute(ORDER_DETAILS_QUERY.format(
+            extra_columns="""
+                , c.customers_first_name, c.customers_surname, c.customers_email,
+                (SELECT ct.contacts_phone_number FROM contacts ct
+                 WHERE ct.contacts_customers_id = o.orders_customers_id LIMIT 1)
+            """,
+            extra_joins="LEFT JOIN customers c ON c.customers_id = o.orders_customers_id"
+        ), (order_number,))
+        rows = cur.fetchall()
+        cur.close()
         
-        cur.execute("""
-            SELECT orders_id, orders_total_price, orders_addresses_id, orders_customers_id, orders_transactions_id
-            FROM orders
-            WHERE orders_number = %s
-        """, (order_number,))
-        orders = cur.fetchall()
-        
-        if not orders:
+        if not rows:
             return jsonify({'error': 'Order not found'}), 404
         
-        order_id = orders[0][0]
-        address_id = orders[0][2]
-        customer_id = orders[0][3]
-        transaction_id = orders[0][4]
-        
-        cur.execute("SELECT * FROM addresses WHERE addresses_id = %s", (address_id,))
-        address = cur.fetchone()
-        
-        cur.execute("SELECT customers_first_name, customers_surname, customers_email FROM customers WHERE customers_id = %s", (customer_id,))
-        customer = cur.fetchone()
-        
-        cur.execute("SELECT contacts_phone_number FROM contacts WHERE contacts_customers_id = %s", (customer_id,))
-        contact = cur.fetchone()
-        
-        cur.execute("""
-            SELECT products.products_id, products.products_name, products.products_price, orders.orders_product_quantity
-            FROM orders
-            JOIN products ON products.products_id = orders.orders_products_id
-            WHERE orders.orders_number = %s
-        """, (order_number,))
-        products = cur.fetchall()
-        
-        cur.close()
-        
-        return jsonify({
-            'order_number': order_number,
-            'total_price': orders[0][1],
+        first = rows[0]
+        order = order_details_from_rows(order_number, rows)
+        order.update({
             'customer': {
-                'first_name': customer[0],
-                'surname': customer[1],
-                'email': customer[2]
+                'first_name': first[14],
+                'surname': first[15],
+                'email': first[16]
             },
             'contact': {
-                'phone_number': contact[0] if contact else None
+                'phone_number': first[17]
             },
             'transaction': {
-                'number': transaction_id,
-                'amount': orders[0][1]
-            },
-            'address': {
-                'id': address[0],
-                'street_one': address[1],
-                'street_two': address[2],
-                'city': address[3],
-                'province': address[4],
-                'country': address[5],
-                'postal_code': address[6]
-            },
-            'products': [{
-                'id': product[0],
-                'name': product[1],
-                'price': product[2],
-                'quantity': product[3]
-            } for product in products]
-        }), 200
+                'number': first[2],
+                'amount': first[0]
+            }
+        })
+        
+        return jsonify(order), 200
 
     except Exception as e:
-        return jsonify({'error': str(e)}), 400
+        return error_response(e)
 
 
 @app.route('/admin/customers', methods=['GET'])
@@ -1059,57 +2869,318 @@ def get_customers():
                 c.customers_surname,
                 c.customers_email,
                 con.contacts_phone_number,
-                COUNT(DISTINCT o.orders_number) AS order_count,
-                SUM(o.orders_total_price) AS total_spent
+                s.customer_stats_order_count AS order_count,
+                s.customer_stats_total_spent AS total_spent,
+                (SELECT COUNT(*) FROM customers) AS total_count
             FROM customers AS c
             LEFT JOIN contacts AS con ON c.customers_id = con.contacts_customers_id
-            LEFT JOIN orders AS o ON c.customers_id = o.orders_customers_id
-            GROUP BY 
-                c.customers_id,
-                c.customers_first_name, 
-                c.customers_surname, 
-                c.customers_email,
-                con.contacts_phone_number
+            LEFT JOIN customer_stats AS s ON c.customers_id = s.customer_stats_customers_id
             ORDER BY c.customers_first_name, c.customers_surname
             LIMIT %s OFFSET %s
         """, (limit, offset))
 
         customers = cur.fetchall()
 
+        addresses = {}
+        if customers:
+            customer_ids = tuple({row[0] for row in customers})
+            placeholders = ", ".join(["%s"] * len(customer_ids))
+            cur.execute(f"""
+                SELECT 
+                    addresses_customers_id,
+                    CONCAT(addresses_street_one, ', ', addresses_street_two, ', ', addresses_city, ', ', addresses_province, ', ', addresses_country, ', ', addresses_postal_code) AS full_address
+                FROM addresses 
+                WHERE addresses_customers_id IN ({placeholders})
+                ORDER BY addresses_customers_id, addresses_id
+            """, customer_ids)
+            for customer_id, full_address in cur.fetchall():
+                addresses.setdefault(customer_id, []).append(full_address)
+
+        cur.close()
+
         result = []
         for row in customers:
-            customer_info = {
+            result.append({
                 'full_name': f"{row[1]} {row[2]}",
                 'email': row[3],
                 'phone_number': row[4],
                 'order_count': row[5] or 0,
-                'total_spent': float(row[6]) if row[6] is not None else 0.0  
-            }
-            
-            cur.execute("""
-                SELECT 
-                    CONCAT(addresses_street_one, ', ', addresses_street_two, ', ', addresses_city, ', ', addresses_province, ', ', addresses_country, ', ', addresses_postal_code) AS full_address
-                FROM addresses 
-                WHERE addresses_customers_id = %s
-            """, (row[0],))
-            addresses = cur.fetchall()
-            customer_info['address'] = '<br />'.join([addr[0] for addr in addresses]) if addresses else ""
-
-            result.append(customer_info)
+                'total_spent': float(row[6]) if row[6] is not None else 0.0,
+                'address': '<br />'.join(addresses.get(row[0], []))
+            })
 
-        cur.close()
-        
-        cur = mysql.connection.cursor()
-        total_query = "SELECT COUNT(*) FROM customers"
-        cur.execute(total_query)
-        total_count = cur.fetchone()[0]
-        cur.close()
+        if customers:
+            total_count = customers[0][7]
+        else:
+            cur = mysql.connection.cursor()
+            cur.execute("SELECT COUNT(*) FROM customers")
+            total_count = cur.fetchone()[0]
+            cur.close()
         
         return jsonify({'customers': result, 'total': total_count}), 200
 
     except Exception as e:
-        return jsonify({'error': str(e)}), 400
-    
+        return error_response(e)
+
+
+app.config['EXPORT_FETCH_SIZE'] = int(os.getenv('EXPORT_FETCH_SIZE', 1000))
+app.config['EXPORT_NET_WRITE_TIMEOUT'] = int(os.getenv('EXPORT_NET_WRITE_TIMEOUT', 600))
+
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+def export_date_range(column):
+    conditions = []
+    params = []
+    start = request.args.get('from')
+    end = request.args.get('to')
+    if start:
+        conditions.append(f"{column} >= %s")
+        params.append(date.fromisoformat(start))
+    if end:
+        conditions.append(f"{column} < %s")
+        params.append(date.fromisoformat(end) + timedelta(days=1))
+    return conditions, params
+
+
+def encode_export_rows(rows, columns, export_format):
+    if export_format == 'ndjson':
+        return ''.join(app.json.dumps(dict(zip(columns, row))) + '\n' for row in rows)
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows([value.isoformat() if isinstance(value, date) else value for value in row] for row in rows)
+    return buffer.getvalue()
+
+
+def stream_export(name, query, params, columns):
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': 'format must be ndjson or csv'}), 400
+
+    # a dedicated connection, not the request one, so it can outlive the view and go back to the pool on close
+    connection = mysql.pool.checkout()
+    state = {'finished': False}
+    try:
+        cur = connection.cursor(MySQLdb.cursors.SSCursor)
+        # the server gives up on a client that stops reading for this long, mid-export included
+        cur.execute("SET SESSION net_write_timeout = %s", (app.config['EXPORT_NET_WRITE_TIMEOUT'],))
+        cur.execute(query, params)
+    except Exception:
+        connection.release(discard=True)
+        raise
+
+    def generate():
+        if export_format == 'csv':
+            yield encode_export_rows([columns], columns, 'csv')
+        while True:
+            rows = cur.fetchmany(app.config['EXPORT_FETCH_SIZE'])
+            if not rows:
+                break
+            yield encode_export_rows(rows, columns, export_format)
+        state['finished'] = True
+
+    response = Response(generate(), mimetype=EXPORT_FORMATS[export_format])
+    response.headers['Content-Disposition'] = f'attachment; filename={name}.{export_format}'
+    response.headers['Cache-Control'] = 'no-store'
+    def close():
+        if state['finished']:
+            # the raised net_write_timeout must not follow the connection back into the pool
+            try:
+                cur.close()
+                reset = connection.raw.cursor()
+                reset.execute("SET SESSION net_write_timeout = DEFAULT")
+                reset.close()
+            except MySQLdb.Error:
+                state['finished'] = False
+        connection.release(discard=not state['finished'])
+
+    response.call_on_close(close)
+    return response
+
+
+@app.route('/orders/admin/export', methods=['GET'])
+def export_orders():
+    lines = request.args.get('lines', 'false').lower() in ('1', 'true')
+    try:
+        conditions, params = export_date_range('o.orders_date' if lines else 'order_headers_date')
+    except ValueError:
+        return jsonify({'error': 'from and to must be dates (YYYY-MM-DD)'}), 400
+    where = "WHERE " + " AND ".join(conditions) if conditions else ""
+
+    if lines:
+        columns = ['order_number', 'date', 'customer_id', 'product_id', 'product_name', 'quantity', 'order_total_price', 'transaction_id', 'seen']
+        query = f"""
+            SELECT o.orders_number, o.orders_date, o.orders_customers_id, o.orders_products_id, p.products_name,
+                   o.orders_product_quantity, o.orders_total_price, o.orders_transactions_id, o.orders_seen
+            FROM orders o
+            LEFT JOIN products p ON p.products_id = o.orders_products_id
+            {where}
+            ORDER BY o.orders_date, o.orders_id
+        """
+        return stream_export('order-lines', query, params, columns)
+
+    columns = ['order_number', 'date', 'customer_id', 'address_id', 'transaction_id', 'total_price', 'seen']
+    query = f"""
+        SELECT order_headers_number, order_headers_date, order_headers_customers_id, order_headers_addresses_id,
+               order_headers_transactions_id, order_headers_total_price, order_headers_seen
+        FROM order_headers
+        {where}
+        ORDER BY order_headers_date
+    """
+    return stream_export('orders', query, params, columns)
+
+
+@app.route('/admin/customers/export', methods=['GET'])
+def export_customers():
+    try:
+        conditions, params = export_date_range('order_headers_date')
+    except ValueError:
+        return jsonify({'error': 'from and to must be dates (YYYY-MM-DD)'}), 400
+
+    columns = ['customer_id', 'first_name', 'surname', 'email', 'phone_number', 'order_count', 'total_spent', 'addresses']
+    addresses = """
+        (SELECT GROUP_CONCAT(CONCAT_WS(', ', addresses_street_one, addresses_street_two, addresses_city,
+                                       addresses_province, addresses_country, addresses_postal_code)
+                             ORDER BY addresses_id SEPARATOR ' | ')
+         FROM addresses WHERE addresses_customers_id = c.customers_id)
+    """
+    if conditions:
+        # order counts and totals for the range come from one grouped pass over order_headers
+        query = f"""
+            SELECT c.customers_id, c.customers_first_name, c.customers_surname, c.customers_email,
+                   con.contacts_phone_number, r.order_count, r.total_spent, {addresses}
+            FROM (
+                SELECT order_headers_customers_id, COUNT(*) AS order_count, SUM(order_headers_total_price) AS total_spent
+                FROM order_headers
+                WHERE {" AND ".join(conditions)}
+                GROUP BY order_headers_customers_id
+            ) AS r
+            JOIN customers c ON c.customers_id = r.order_headers_customers_id
+            LEFT JOIN contacts con ON con.contacts_customers_id = c.customers_id
+            ORDER BY c.customers_id
+        """
+    else:
+        query = f"""
+            SELECT c.customers_id, c.customers_first_name, c.customers_surname, c.customers_email,
+                   con.contacts_phone_number, COALESCE(s.customer_stats_order_count, 0),
+                   COALESCE(s.customer_stats_total_spent, 0), {addresses}
+            FROM customers c
+            LEFT JOIN contacts con ON con.contacts_customers_id = c.customers_id
+            LEFT JOIN customer_stats s ON s.customer_stats_customers_id = c.customers_id
+            ORDER BY c.customers_id
+        """
+    return stream_export('customers', query, params, columns)
+
+
+@app.cli.command('migrate')
+def migrate():
+    applied = schema.migrate(mysql.connection)
+    for version, name in applied:
+        print(f'Applied migration {version}: {name}')
+    if not applied:
+        print('Schema is up to date')
+
+
+@app.cli.command('check-query-plans')
+@click.argument('statements_file', type=click.File())
+@click.option('--min-rows', default=1000, help='Fail on full table scans estimated to read at least this many rows.')
+def check_query_plans(statements_file, min_rows):
+    statements = json.load(statements_file)
+    failures = schema.check_query_plans(mysql.connection, statements, min_rows)
+    for failure in failures:
+        print(f"Full scan of {failure['table']} ({failure['rows']} rows) in {failure['route']}: {failure['query']}\n  {failure['extra']}")
+    if failures:
+        sys.exit(1)
+    print(f'{len(statements)} statements checked, no full table scans')
+
+
+@app.cli.command('rebuild-customer-stats')
+def rebuild_customer_stats():
+    cur = mysql.connection.cursor()
+    cur.execute(schema.CUSTOMER_STATS_TABLE)
+    try:
+        cur.execute("DELETE FROM customer_stats")
+        cur.execute(schema.CUSTOMER_STATS_BACKFILL)
+        rebuilt = cur.rowcount
+        mysql.connection.commit()
+    except Exception:
+        mysql.connection.rollback()
+        raise
+    finally:
+        cur.close()
+    print(f'Rebuilt customer_stats for {rebuilt} customers')
+
+
+@app.cli.command('rebuild-order-headers')
+def rebuild_order_headers():
+    cur = mysql.connection.cursor()
+    cur.execute(schema.ORDER_HEADERS_TABLE)
+    try:
+        cur.execute("DELETE FROM order_headers")
+        cur.execute(schema.ORDER_HEADERS_BACKFILL)
+        rebuilt = cur.rowcount
+        mysql.connection.commit()
+    except Exception:
+        mysql.connection.rollback()
+        raise
+    finally:
+        cur.close()
+    print(f'Rebuilt order_headers for {rebuilt} orders')
+
+
+@app.cli.command('rebuild-admin-counters')
+def rebuild_admin_counters():
+    cur = mysql.connection.cursor()
+    cur.execute(schema.ADMIN_COUNTERS_TABLE)
+    try:
+        cur.execute(schema.ADMIN_COUNTERS_BACKFILL)
+        mysql.connection.commit()
+    except Exception:
+        mysql.connection.rollback()
+        raise
+    finally:
+        cur.close()
+    print('Rebuilt admin_counters')
+
+
+@app.route('/admin/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify({'catalog_cache': catalog_cache.stats()}), 200
+
+
+def metric_lines(name, metric_type, help_text, value):
+    return [f'# HELP {name} {help_text}', f'# TYPE {name} {metric_type}', f'{name} {value}']
+
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    pool_stats = mysql.pool.stats()
+    cache_stats = catalog_cache.stats()
+    hash_stats = hash_pool.stats()
+
+    lines = request_metrics.render()
+    lines += metric_lines('db_pool_in_use', 'gauge', 'MySQL connections checked out.', pool_stats['in_use'])
+    lines += metric_lines('db_pool_open', 'gauge', 'MySQL connections open.', pool_stats['open'])
+    lines += metric_lines('db_pool_saturation', 'gauge', 'Share of the pool capacity in use.', pool_stats['saturation'])
+    lines += metric_lines('db_pool_checkout_waits_total', 'counter', 'Checkouts that had to wait for a connection.', pool_stats['waits'])
+    lines += metric_lines('db_pool_checkout_timeouts_total', 'counter', 'Checkouts that gave up waiting.', pool_stats['timeouts'])
+    lines += metric_lines('catalog_cache_hits_total', 'counter', 'Catalog cache hits.', cache_stats['hits'])
+    lines += metric_lines('catalog_cache_misses_total', 'counter', 'Catalog cache misses.', cache_stats['misses'])
+    lines += metric_lines('catalog_cache_entries', 'gauge', 'Catalog cache entries.', cache_stats['entries'])
+    lines += metric_lines('hash_pool_in_flight', 'gauge', 'Password hashing calls in flight.', hash_stats['in_flight'])
+    lines += metric_lines('hash_pool_rejected_total', 'counter', 'Password hashing calls rejected because the queue was full.', hash_stats['rejected'])
+
+    return Response('\n'.join(lines) + '\n', mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/admin/db_pool/stats', methods=['GET'])
+def get_db_pool_stats():
+    return jsonify({'db_pool': mysql.pool.stats()}), 200
+
+
+@app.route('/admin/hash_pool/stats', methods=['GET'])
+def get_hash_pool_stats():
+    return jsonify({'hash_pool': hash_pool.stats()}), 200
+
 
 @app.route('/transactions', methods=['POST'])
 def create_payment():
@@ -0,0 +1,553 @@
+import argparse
+import csv
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import nullcontext
+from datetime import date, datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import bcrypt
+import MySQLdb
+import requests
+from dotenv import load_dotenv
+
+load_dotenv()
+
+BENCH_PASSWORD = 'bench-password'
+CATEGORIES = ['hats', 'scarves', 'sweaters', 'blankets', 'toys', 'bags', 'socks', 'gloves']
+MATERIALS = ['wool', 'cotton', 'acrylic', 'alpaca', 'mohair', 'linen', 'bamboo']
+WORDS = ['soft', 'warm', 'chunky', 'hand', 'made', 'knit', 'crochet', 'cozy', 'classic', 'winter',
+         'summer', 'striped', 'cable', 'lace', 'ribbed', 'pastel', 'natural', 'gift', 'baby', 'granny']
+
+# The production tables are managed outside this repository; this mirrors the columns app.py relies on.
+BASE_TABLES = [
+    """
+    CREATE TABLE products (
+        products_id INT AUTO_INCREMENT PRIMARY KEY,
+        products_name VARCHAR(255) NOT NULL,
+        products_category VARCHAR(64) NOT NULL,
+        products_description TEXT,
+        products_material VARCHAR(64),
+        products_quantity INT NOT NULL DEFAULT 0,
+        products_price DECIMAL(10, 2) NOT NULL,
+        products_price_discounted_10 DECIMAL(10, 2) AS (ROUND(products_price * 0.9, 2)) STORED,
+        products_price_discounted_20 DECIMAL(10, 2) AS (ROUND(products_price * 0.8, 2)) STORED
+    )
+    """,
+    """
+    CREATE TABLE images (
+        images_id INT AUTO_INCREMENT PRIMARY KEY,
+        images_url VARCHAR(255) NOT NULL,
+        images_products_id INT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE customers (
+        customers_id INT AUTO_INCREMENT PRIMARY KEY,
+        customers_first_name VARCHAR(64) NOT NULL,
+        customers_surname VARCHAR(64) NOT NULL,
+        customers_email VARCHAR(255) NOT NULL,
+        customers_password VARCHAR(255) NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE administrators (
+        administrators_id INT AUTO_INCREMENT PRIMARY KEY,
+        administrators_first_name VARCHAR(64) NOT NULL,
+        administrators_surname VARCHAR(64) NOT NULL,
+        administrators_email VARCHAR(255) NOT NULL,
+        administrators_password VARCHAR(255) NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE addresses (
+        addresses_id INT AUTO_INCREMENT PRIMARY KEY,
+        addresses_street_one VARCHAR(255),
+        addresses_street_two VARCHAR(255),
+        addresses_city VARCHAR(64),
+        addresses_province VARCHAR(64),
+        addresses_country VARCHAR(64),
+        addresses_postal_code VARCHAR(16),
+        addresses_customers_id INT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE contacts (
+        contacts_id INT AUTO_INCREMENT PRIMARY KEY,
+        contacts_phone_number VARCHAR(32),
+        contacts_customers_id INT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE orders (
+        orders_id INT AUTO_INCREMENT PRIMARY KEY,
+        orders_number VARCHAR(64) NOT NULL,
+        orders_products_id INT NOT NULL,
+        orders_product_quantity INT NOT NULL,
+        orders_customers_id INT NOT NULL,
+        orders_addresses_id INT,
+        orders_total_price DECIMAL(12, 2) NOT NULL,
+        orders_transactions_id VARCHAR(255),
+        orders_date DATETIME NOT NULL,
+        orders_seen TINYINT(1) NOT NULL DEFAULT 0
+    )
+    """,
+    """
+    CREATE TABLE transactions (
+        transactions_id INT AUTO_INCREMENT PRIMARY KEY,
+        transactions_payer_name VARCHAR(255),
+        transactions_payer_email VARCHAR(255),
+        transactions_number VARCHAR(255),
+        transactions_amount DECIMAL(12, 2)
+    )
+    """
+]
+
+
+def words(rng, count):
+    return ' '.join(rng.choice(WORDS) for _ in range(count))
+
+
+def insert_batches(cur, query, rows, batch_size=1000):
+    for start in range(0, len(rows), batch_size):
+        cur.executemany(query, rows[start:start + batch_size])
+
+
+def seed(args):
+    import schema
+
+    rng = random.Random(args.random_seed)
+    connection = MySQLdb.connect(host=os.getenv('MYSQL_HOST'), user=os.getenv('MYSQL_USER'), password=os.getenv('MYSQL_PASSWORD'),
+                                 port=int(os.getenv('MYSQL_PORT')), charset='utf8', use_unicode=True)
+    cur = connection.cursor()
+    cur.execute(f"DROP DATABASE IF EXISTS `{args.database}`")
+    cur.execute(f"CREATE DATABASE `{args.database}`")
+    cur.execute(f"USE `{args.database}`")
+    for table in BASE_TABLES:
+        cur.execute(table)
+
+    password_hash = bcrypt.hashpw(BENCH_PASSWORD.encode('utf-8'), bcrypt.gensalt(int(os.getenv('BCRYPT_ROUNDS', 12)))).decode('utf-8')
+
+    print(f'Seeding {args.products} products')
+    insert_batches(cur, """
+        INSERT INTO products (products_name, products_category, products_description, products_material, products_quantity, products_price)
+        VALUES (%s, %s, %s, %s, %s, %s)
+    """, [(words(rng, 3).title(), rng.choice(CATEGORIES), words(rng, rng.randint(40, 120)), rng.choice(MATERIALS),
+           rng.randint(0, 10000), round(rng.uniform(5, 250), 2)) for _ in range(args.products)])
+    insert_batches(cur, "INSERT INTO images (images_url, images_products_id) VALUES (%s, %s)",
+                   [(f'https://i.example.com/{product_id}-{i}.jpg', product_id)
+                    for product_id in range(1, args.products + 1) for i in range(rng.randint(1, 3))])
+
+    print(f'Seeding {args.customers} customers')
+    insert_batches(cur, """
+        INSERT INTO customers (customers_first_name, customers_surname, customers_email, customers_password)
+        VALUES (%s, %s, %s, %s)
+    """, [(rng.choice(WORDS).title(), rng.choice(WORDS).title(), f'customer{i}@bench.test', password_hash)
+          for i in range(1, args.customers + 1)])
+    insert_batches(cur, """
+        INSERT INTO addresses (addresses_street_one, addresses_street_two, addresses_city, addresses_province, addresses_country, addresses_postal_code, addresses_customers_id)
+        VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """, [(f'{rng.randint(1, 999)} {rng.choice(WORDS).title()} Street', 'Apt 1', 'Kyiv', 'Kyiv', 'Ukraine', f'{rng.randint(10000, 99999)}', customer_id)
+          for customer_id in range(1, args.customers + 1) for _ in range(rng.randint(1, 2))])
+    insert_batches(cur, "INSERT INTO contacts (contacts_phone_number, contacts_customers_id) VALUES (%s, %s)",
+                   [(f'+380{rng.randint(100000000, 999999999)}', customer_id) for customer_id in range(1, args.customers + 1)])
+    insert_batches(cur, """
+        INSERT INTO administrators (administrators_first_name, administrators_surname, administrators_email, administrators_password)
+        VALUES (%s, %s, %s, %s)
+    """, [('Bench', 'Admin', f'admin{i}@bench.test', password_hash) for i in range(1, args.administrators + 1)])
+
+    print(f'Seeding {args.order_lines} order lines')
+    cur.execute("SELECT addresses_customers_id, MIN(addresses_id) FROM addresses GROUP BY addresses_customers_id")
+    customer_addresses = dict(cur.fetchall())
+    start_date = datetime.now() - timedelta(days=730)
+    lines = []
+    order_index = 0
+    while len(lines) < args.order_lines:
+        order_index += 1
+        customer_id = rng.randint(1, args.customers)
+        order_date = start_date + timedelta(seconds=rng.randint(0, 730 * 86400))
+        total = round(rng.uniform(10, 800), 2)
+        seen = 1 if rng.random() < 0.95 else 0
+        for _ in range(rng.randint(1, 5)):
+            lines.append((f'B{order_index:09d}', rng.randint(1, args.products), rng.randint(1, 3), customer_id,
+                          customer_addresses[customer_id], total, f'TX{order_index:09d}', order_date, seen))
+    insert_batches(cur, """
+        INSERT INTO orders (orders_number, orders_products_id, orders_product_quantity, orders_customers_id, orders_addresses_id, orders_total_price, orders_transactions_id, orders_date, orders_seen)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+    """, lines[:args.order_lines])
+    connection.commit()
+
+    for version, name in schema.migrate(connection):
+        print(f'Applied migration {version}: {name}')
+    cur.close()
+    connection.close()
+
+
+class StubImageHost(BaseHTTPRequestHandler):
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        body = json.dumps({'data': {'link': f'https://i.example.com/stub-{time.monotonic_ns()}.jpg'}}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_stub_image_host(port=0):
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubImageHost)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_address[1]}/3/image'
+
+
+def live_count(count):
+    # the last tenth of every seeded table is left to the delete routes, everything else only reads the rest
+    return max(count - count // 10, 1)
+
+
+class Traffic:
+    OBSERVED = {'upload_image_async'}
+    IMAGE_UPLOAD_ROUTES = ('upload_image', 'upload_image_async')
+
+    def __init__(self, args, rng, application):
+        self.args = args
+        self.rng = rng
+        self.application = application
+        self.counter = 0
+        self.job_ids = deque(maxlen=100)
+        self.spare = {table: deque(range(live_count(count) + 1, count + 1))
+                      for table, count in (('products', args.products), ('customers', args.customers),
+                                           ('administrators', args.administrators), ('addresses', args.customers))}
+
+    def unique(self):
+        self.counter += 1
+        return f'{os.getpid()}-{time.time_ns()}-{self.counter}'
+
+    def product_id(self):
+        return self.rng.randint(1, live_count(self.args.products))
+
+    def customer_id(self):
+        return self.rng.randint(1, live_count(self.args.customers))
+
+    def administrator_id(self):
+        return self.rng.randint(1, live_count(self.args.administrators))
+
+    def address_id(self):
+        # every seeded customer has at least one address, so ids up to the customer count exist
+        return self.rng.randint(1, live_count(self.args.customers))
+
+    def spare_id(self, table):
+        # rows still waiting for their delete; once they are gone the update is a 404 with the same statements
+        return self.rng.choice(self.spare[table]) if self.spare[table] else 0
+
+    def disposable_id(self, table):
+        return self.spare[table].popleft() if self.spare[table] else 0
+
+    def order_number(self):
+        return f'B{self.rng.randint(1, self.args.order_lines // 3):09d}'
+
+    def job_id(self):
+        return self.rng.choice(self.job_ids) if self.job_ids else uuid.uuid4().hex
+
+    def observe(self, name, body):
+        if name == 'upload_image_async' and isinstance(body, dict) and body.get('job_id'):
+            self.job_ids.append(body['job_id'])
+
+    def image(self):
+        return (io.BytesIO(b'\x89PNG\r\n\x1a\n' + os.urandom(2048)), 'image.png', 'image/png')
+
+    def date_range(self, days):
+        end = date.today() - timedelta(days=self.rng.randint(0, 730 - days))
+        return {'from': (end - timedelta(days=days)).isoformat(), 'to': end.isoformat()}
+
+    def import_csv(self, rows):
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(['products_name', 'products_category', 'products_description', 'products_material', 'products_quantity', 'products_price', 'images'])
+        for _ in range(rows):
+            writer.writerow([f'Import {self.unique()}', self.rng.choice(CATEGORIES), words(self.rng, 40), self.rng.choice(MATERIALS),
+                             self.rng.randint(0, 500), f'{self.rng.uniform(5, 250):.2f}', f'https://i.example.com/import-{self.unique()}.jpg'])
+        return buffer.getvalue()
+
+    def address(self):
+        return {'addresses_street_one': '2 Bench St', 'addresses_street_two': '', 'addresses_city': 'Lviv', 'addresses_province': 'Lviv',
+                'addresses_country': 'Ukraine', 'addresses_postal_code': '79000'}
+
+    def requests(self):
+        rng = self.rng
+        return {
+            'home': (1, lambda: ('GET', '/', {})),
+            'get_products': (20, lambda: ('GET', '/products', {'query_string': {'page': rng.randint(1, 50)}})),
+            'get_products_category': (10, lambda: ('GET', '/products', {'query_string': {'category': rng.choice(CATEGORIES), 'page': rng.randint(1, 5)}})),
+            'get_products_filtered': (5, lambda: ('GET', '/products', {'query_string': {
+                'min_price': rng.choice([10, 25, 50]), 'max_price': rng.choice([100, 150, 250]), 'material': rng.choice(MATERIALS),
+                'in_stock': 'true', 'sort': rng.choice(['newest', 'price_asc', 'price_desc']), 'facets': rng.choice(['true', 'false'])}})),
+            'get_products_cursor': (5, lambda: ('GET', '/products', {'query_string': {'after': self.application.encode_cursor(self.product_id())}})),
+            'get_product': (20, lambda: ('GET', f'/product/{self.product_id()}', {})),
+            'search_products': (5, lambda: ('GET', '/products/search', {'query_string': {'q': words(rng, rng.randint(1, 2)), 'page': rng.randint(1, 3)}})),
+            'add_product': (1, lambda: ('POST', '/products', {'data': {
+                'products_name': f'Bench {self.unique()}', 'products_category': rng.choice(CATEGORIES),
+                'products_description': words(rng, 60), 'products_material': rng.choice(MATERIALS),
+                'products_quantity': 100, 'products_price': '19.99'}})),
+            'update_product': (1, lambda: ('PATCH', f'/products/{self.product_id()}', {'data': {'products_quantity': rng.randint(100, 1000)}})),
+            'update_products': (1, lambda: ('PATCH', '/products', {'json': [
+                {'products_id': products_id, 'stock_delta': rng.randint(1, 5)} for products_id in rng.sample(range(1, live_count(self.args.products) + 1), 20)]})),
+            'import_products': (1, lambda: ('POST', '/products/import', {'data': self.import_csv(20), 'content_type': 'text/csv'})),
+            'delete_product': (1, lambda: ('DELETE', f'/products/{self.disposable_id("products")}', {})),
+            'upload_image': (1, lambda: ('POST', '/upload_image', {'data': {'products_id': self.product_id(), 'image_product_0': self.image()}})),
+            'upload_image_async': (1, lambda: ('POST', '/upload_image', {'query_string': {'async': '1'}, 'data': {'products_id': self.product_id(), 'image_product_0': self.image()}})),
+            'get_image_job': (1, lambda: ('GET', f'/upload_image/jobs/{self.job_id()}', {})),
+            'add_customer': (1, lambda: ('POST', '/customers', {'json': {
+                'first_name': 'Bench', 'surname': 'Customer', 'email': f'{self.unique()}@bench.test', 'password': BENCH_PASSWORD,
+                'address': {'street_one': '1 Bench St', 'street_two': '', 'city': 'Kyiv', 'province': 'Kyiv', 'country': 'Ukraine', 'postal_code': '01001'},
+                'contact': {'phone_number': '+380000000000'}}})),
+            'login': (3, lambda: ('POST', '/login', {'json': {'email': f'customer{self.customer_id()}@bench.test', 'password': BENCH_PASSWORD}})),
+            'verify_customer_password': (1, lambda: ('POST', '/customers/verify_password', {'json': {'customers_id': self.customer_id(), 'customers_password': BENCH_PASSWORD}})),
+            'update_customer_email': (1, lambda: ('PATCH', '/customers/update_email', {'json': {'customers_id': self.spare_id('customers'), 'customers_email': f'{self.unique()}@bench.test'}})),
+            'update_customer_password': (1, lambda: ('PATCH', '/customers/update_password', {'json': {'customers_id': self.customer_id(), 'customers_password': BENCH_PASSWORD}})),
+            'update_customer_phone': (1, lambda: ('PATCH', '/customers/update_phone', {'json': {'customers_id': self.customer_id(), 'customers_phone_number': '+380111111111'}})),
+            'delete_customer': (1, lambda: ('DELETE', f'/customers/{self.disposable_id("customers")}', {})),
+            'add_administrator': (1, lambda: ('POST', '/administrators', {'json': {
+                'first_name': 'Bench', 'surname': 'Admin', 'email': f'{self.unique()}@bench.test', 'password': BENCH_PASSWORD}})),
+            'verify_administrator_password': (1, lambda: ('POST', '/administrators/verify_password', {'json': {'administrators_id': self.administrator_id(), 'administrators_password': BENCH_PASSWORD}})),
+            'update_administrator_email': (1, lambda: ('PATCH', '/administrators/update_email', {'json': {'administrators_id': self.spare_id('administrators'), 'administrators_email': f'{self.unique()}@bench.test'}})),
+            'update_administrator_password': (1, lambda: ('PATCH', '/administrators/update_password', {'json': {'administrators_id': self.administrator_id(), 'administrators_password': BENCH_PASSWORD}})),
+            'delete_administrator': (1, lambda: ('DELETE', f'/administrators/{self.disposable_id("administrators")}', {})),
+            'get_customer': (3, lambda: ('GET', f'/customers/{self.customer_id()}', {})),
+            'get_addresses': (3, lambda: ('GET', f'/customers/{self.customer_id()}/addresses', {})),
+            'get_address': (1, lambda: ('GET', f'/addresses/{self.address_id()}', {})),
+            'add_address': (1, lambda: ('POST', '/add_address', {'json': {**self.address(), 'customers_id': self.customer_id()}})),
+            'update_address': (1, lambda: ('PATCH', '/update_address', {'json': {**self.address(), 'address_id': self.address_id()}})),
+            'delete_address': (1, lambda: ('DELETE', f'/delete_address/{self.disposable_id("addresses")}', {})),
+            'create_order': (2, lambda: ('POST', '/orders', {'json': {
+                'orders_number': f'N{self.unique()}', 'orders_products_id': [self.product_id() for _ in range(rng.randint(1, 6))],
+                'orders_product_quantity': None, 'orders_customers_id': self.customer_id(), 'orders_addresses_id': 1,
+                'orders_total_price': '42.00', 'orders_transactions_id': f'T{self.unique()}'}})),
+            'get_user_orders': (3, lambda: ('GET', f'/orders/user/{self.customer_id()}', {})),
+            'get_order_details': (3, lambda: ('GET', f'/orders/user/number/{self.order_number()}', {})),
+            'get_all_orders': (3, lambda: ('GET', '/orders/admin', {'query_string': {'page': rng.randint(1, 20)}})),
+            'get_unseen_orders_page': (1, lambda: ('GET', '/orders/admin', {'query_string': {'seen': 'false'}})),
+            'get_unseen_orders': (1, lambda: ('GET', '/orders/admin/unseen', {})),
+            'mark_order_as_seen': (1, lambda: ('PATCH', f'/orders/mark-seen/{self.order_number()}', {})),
+            'get_order_details_admin': (3, lambda: ('GET', f'/orders/admin/number/{self.order_number()}', {})),
+            'get_customers': (3, lambda: ('GET', '/admin/customers', {'query_string': {'page': rng.randint(1, 50)}})),
+            'export_orders': (1, lambda: ('GET', '/orders/admin/export', {'query_string': {**self.date_range(7), 'lines': rng.choice(['true', 'false']), 'format': rng.choice(['ndjson', 'csv'])}})),
+            'export_customers': (1, lambda: ('GET', '/admin/customers/export', {'query_string': {**self.date_range(7), 'format': rng.choice(['ndjson', 'csv'])}})),
+            'create_payment': (1, lambda: ('POST', '/transactions', {'json': {
+                'payer_name': 'Bench Payer', 'payer_email': 'payer@bench.test', 'transaction_id': f'T{self.unique()}', 'amount': '42.00'}})),
+            'stats': (1, lambda: ('GET', rng.choice(['/admin/cache/stats', '/admin/db_pool/stats', '/admin/hash_pool/stats']), {})),
+            'metrics': (1, lambda: ('GET', '/metrics', {}))
+        }
+
+
+def fill_order_quantities(kwargs):
+    order = kwargs.get('json')
+    if order and 'orders_product_quantity' in order and order['orders_product_quantity'] is None:
+        order['orders_product_quantity'] = [1] * len(order['orders_products_id'])
+
+
+def parse_mix(mix, available):
+    if not mix:
+        return {name: weight for name, (weight, build) in available.items()}
+    weights = {}
+    for item in mix.split(','):
+        name, _, weight = item.partition('=')
+        if name not in available:
+            raise SystemExit(f'Unknown route {name!r}, choose from: {", ".join(sorted(available))}')
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def run(args):
+    os.environ['MYSQL_DB'] = args.database
+    if args.json_provider:
+        os.environ['JSON_PROVIDER'] = args.json_provider
+    import app as application
+
+    flask_app = application.app
+    stub_url = start_stub_image_host(args.stub_port)
+    flask_app.config['IMAGE_UPLOAD_URL'] = stub_url
+    client = flask_app.test_client()
+    session = requests.Session()
+
+    rng = random.Random(args.random_seed)
+    traffic = Traffic(args, rng, application)
+    available = traffic.requests()
+    if args.base_url and not args.stub_port:
+        # a running server uploads to its own IMAGE_UPLOAD_URL, which is the real image host unless it was pointed at the stub
+        for name in Traffic.IMAGE_UPLOAD_ROUTES:
+            del available[name]
+    elif args.base_url:
+        print(f'Image uploads need the server to run with IMAGE_UPLOAD_URL={stub_url}')
+    weights = parse_mix(args.mix, available)
+    names = list(weights)
+    results = {name: {'latencies': [], 'queries': [], 'bytes': [], 'errors': 0} for name in names}
+    headers = {'Accept-Encoding': args.accept_encoding} if args.accept_encoding else {}
+
+    def send(name):
+        method, path, kwargs = available[name][1]()
+        fill_order_quantities(kwargs)
+        queries_before = application.mysql.pool.queries
+        started = time.perf_counter()
+        if args.base_url:
+            kwargs = dict(kwargs)
+            if 'query_string' in kwargs:
+                kwargs['params'] = kwargs.pop('query_string')
+            request_headers = dict(headers)
+            if 'content_type' in kwargs:
+                request_headers['Content-Type'] = kwargs.pop('content_type')
+            if 'data' in kwargs and any(isinstance(value, tuple) for value in kwargs['data'].values()):
+                data = kwargs.pop('data')
+                kwargs['files'] = {key: (value[1], value[0], value[2]) for key, value in data.items() if isinstance(value, tuple)}
+                kwargs['data'] = {key: value for key, value in data.items() if not isinstance(value, tuple)}
+            response = session.request(method, args.base_url.rstrip('/') + path, headers=request_headers, **kwargs)
+            # requests decodes gzip bodies, the transfer size is what Content-Length says
+            size = int(response.headers.get('Content-Length', len(response.content)))
+            status, queries = response.status_code, None
+        else:
+            response = client.open(path, method=method, headers=headers, **kwargs)
+            status, size = response.status_code, len(response.get_data())
+            queries = application.mysql.pool.queries - queries_before
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if name in traffic.OBSERVED:
+            traffic.observe(name, response.json() if args.base_url else response.get_json(silent=True))
+        # exports hand their pooled connection back only when the response is closed
+        response.close()
+        return status, size, queries, elapsed_ms
+
+    # capturing costs a fingerprint and a mogrify per statement, so it only runs when asked for
+    with application.capture_statements() if args.statements else nullcontext({}) as statements:
+        for _ in range(args.warmup):
+            send(rng.choices(names, [weights[name] for name in names])[0])
+
+        started = time.perf_counter()
+        for _ in range(args.requests):
+            name = rng.choices(names, [weights[name] for name in names])[0]
+            status, size, queries, elapsed_ms = send(name)
+            result = results[name]
+            result['latencies'].append(elapsed_ms)
+            result['bytes'].append(size)
+            if queries is not None:
+                result['queries'].append(queries)
+            if status >= 500:
+                result['errors'] += 1
+        elapsed = time.perf_counter() - started
+
+    if args.statements:
+        with open(args.statements, 'w') as statements_file:
+            json.dump(sorted(statements.values(), key=lambda item: (item['route'], item['fingerprint'])), statements_file, indent=2)
+        print(f'Saved {len(statements)} statements to {args.statements}')
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'target': args.base_url or 'flask-test-client',
+        'requests': args.requests,
+        'seconds': elapsed,
+        'throughput_rps': args.requests / elapsed if elapsed else 0.0,
+        'routes': {}
+    }
+    for name, result in results.items():
+        latencies = result['latencies']
+        if not latencies:
+            continue
+        report['routes'][name] = {
+            'count': len(latencies),
+            'errors': result['errors'],
+            'p50_ms': percentile(latencies, 0.50),
+            'p95_ms': percentile(latencies, 0.95),
+            'p99_ms': percentile(latencies, 0.99),
+            'queries_per_request': sum(result['queries']) / len(result['queries']) if result['queries'] else None,
+            'bytes_per_response': sum(result['bytes']) / len(result['bytes'])
+        }
+    return report
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report, baseline=None):
+    print(f"{report['requests']} requests in {report['seconds']:.2f}s, {report['throughput_rps']:.1f} req/s ({report['target']}, {report['commit']})")
+    if baseline:
+        print(f"baseline {baseline['commit']}: {baseline['throughput_rps']:.1f} req/s")
+    print(f"{'route':<28}{'count':>7}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}{'bytes':>9}")
+    for name, route in sorted(report['routes'].items()):
+        queries = route['queries_per_request']
+        print(f"{name:<28}{route['count']:>7}{route['errors']:>5}{route['p50_ms']:>10.2f}{route['p95_ms']:>10.2f}{route['p99_ms']:>10.2f}"
+              f"{queries if queries is not None else float('nan'):>9.2f}{route['bytes_per_response']:>9.0f}")
+        previous = (baseline or {}).get('routes', {}).get(name)
+        if previous:
+            def delta(key):
+                return (route[key] - previous[key]) / previous[key] * 100 if previous[key] else 0.0
+            print(f"{'  vs baseline':<40}{delta('p50_ms'):>+9.1f}%{delta('p95_ms'):>+9.1f}%{delta('p99_ms'):>+9.1f}%"
+                  f"{(queries or 0) - (previous['queries_per_request'] or 0):>+9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Seed a synthetic store and replay traffic against every route in app.py.')
+    parser.add_argument('--database', default=os.getenv('BENCH_MYSQL_DB', 'crochet_bench'), help='Database to seed and benchmark; it is dropped by --seed.')
+    parser.add_argument('--seed', action='store_true', help='Drop and recreate the benchmark database before running.')
+    parser.add_argument('--products', type=int, default=5000)
+    parser.add_argument('--customers', type=int, default=20000)
+    parser.add_argument('--administrators', type=int, default=50)
+    parser.add_argument('--order-lines', type=int, default=300000)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--warmup', type=int, default=100)
+    parser.add_argument('--mix', help='Comma separated route=weight pairs, defaults to a read-heavy mix over every route.')
+    parser.add_argument('--base-url', help='Replay against a running server (for example a local gunicorn) instead of the Flask test client.')
+    parser.add_argument('--accept-encoding', help='Accept-Encoding header to send with every request.')
+    parser.add_argument('--json-provider', choices=['orjson', 'default'], help='JSON provider for the in-process app (sets JSON_PROVIDER).')
+    parser.add_argument('--stub-port', type=int, default=0,
+                        help='Port for the stub image host. With --base-url the upload routes only run when this is set and the server uses the stub as IMAGE_UPLOAD_URL.')
+    parser.add_argument('--random-seed', type=int, default=1)
+    parser.add_argument('--save', help='Write the report as a JSON baseline to this path.')
+    parser.add_argument('--compare', help='Compare against a JSON baseline saved with --save.')
+    parser.add_argument('--statements', help='Save one sample of every SQL statement the routes ran, for flask check-query-plans (test client only).')
+    args = parser.parse_args()
+
+    if args.database == os.getenv('MYSQL_DB') and args.seed:
+        raise SystemExit('Refusing to seed the database configured in MYSQL_DB, pass a separate --database')
+
+    if args.statements and args.base_url:
+        raise SystemExit('--statements only sees the queries of the in-process test client, drop --base-url')
+
+    if args.seed:
+        seed(args)
+
+    report = run(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+    print_report(report, baseline)
+
+    if args.save:
+        with open(args.save, 'w') as report_file:
+            json.dump(report, report_file, indent=2)
+        print(f'Saved baseline to {args.save}')
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,9 @@
+import os
+
+from dotenv import load_dotenv
+
+# app reads MYSQL_PORT at import time; the tests that need MySQL skip themselves when it is not reachable
+load_dotenv()
+os.environ.setdefault('MYSQL_PORT', '3306')
+
+pytest_plugins = ['querycheck']
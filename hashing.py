@@ -0,0 +1,10 @@
+# Runs inside the bcrypt worker processes; keep imports to bcrypt so a forkserver child starts fast.
+import bcrypt
+
+
+def bcrypt_hash(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+
+def bcrypt_check(password, hashed):
+    return bcrypt.checkpw(password, hashed)
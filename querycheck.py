@@ -0,0 +1,32 @@
+import json
+
+import pytest
+
+import app as application
+
+
+def pytest_addoption(parser):
+    parser.addoption('--save-statements', help='Write one sample of every SQL statement the tests ran, for flask check-query-plans.')
+
+
+@pytest.fixture(scope='session', autouse=True)
+def captured_statements(request):
+    path = request.config.getoption('save_statements')
+    if not path:
+        yield None
+        return
+    with application.capture_statements() as statements:
+        yield statements
+    with open(path, 'w') as statements_file:
+        json.dump(sorted(statements.values(), key=lambda item: (item['route'], item['fingerprint'])), statements_file, indent=2)
+
+
+@pytest.fixture
+def query_guard():
+    with application.query_guard(slow_ms=application.app.config['SLOW_QUERY_MS'] or None) as report:
+        yield report
+
+
+@pytest.fixture
+def client(query_guard):
+    return application.app.test_client()
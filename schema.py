@@ -0,0 +1,198 @@
+CUSTOMER_STATS_TABLE = """
+    CREATE TABLE IF NOT EXISTS customer_stats (
+        customer_stats_customers_id INT NOT NULL PRIMARY KEY,
+        customer_stats_order_count INT NOT NULL DEFAULT 0,
+        customer_stats_total_spent DECIMAL(12, 2) NOT NULL DEFAULT 0
+    )
+"""
+
+# orders_total_price is repeated on every line, so collapse lines to one row per order first
+CUSTOMER_STATS_BACKFILL = """
+    INSERT INTO customer_stats (customer_stats_customers_id, customer_stats_order_count, customer_stats_total_spent)
+    SELECT orders_customers_id, COUNT(*), SUM(orders_total_price)
+    FROM (
+        SELECT orders_number, orders_customers_id, MAX(orders_total_price) AS orders_total_price
+        FROM orders
+        GROUP BY orders_number, orders_customers_id
+    ) AS order_totals
+    GROUP BY orders_customers_id
+"""
+
+ORDER_HEADERS_TABLE = """
+    CREATE TABLE IF NOT EXISTS order_headers (
+        order_headers_number VARCHAR(64) NOT NULL PRIMARY KEY,
+        order_headers_customers_id INT NOT NULL,
+        order_headers_addresses_id INT NULL,
+        order_headers_transactions_id VARCHAR(255) NULL,
+        order_headers_total_price DECIMAL(12, 2) NOT NULL,
+        order_headers_date DATETIME NOT NULL,
+        order_headers_seen TINYINT(1) NOT NULL DEFAULT 0,
+        INDEX order_headers_date_idx (order_headers_date),
+        INDEX order_headers_customers_date_idx (order_headers_customers_id, order_headers_date),
+        INDEX order_headers_seen_date_idx (order_headers_seen, order_headers_date)
+    )
+"""
+
+ORDER_HEADERS_BACKFILL = """
+    INSERT INTO order_headers (order_headers_number, order_headers_customers_id, order_headers_addresses_id, order_headers_transactions_id, order_headers_total_price, order_headers_date, order_headers_seen)
+    SELECT orders_number, MAX(orders_customers_id), MAX(orders_addresses_id), MAX(orders_transactions_id),
+           MAX(orders_total_price), MIN(orders_date), MIN(orders_seen)
+    FROM orders
+    GROUP BY orders_number
+"""
+
+ADMIN_COUNTERS_TABLE = """
+    CREATE TABLE IF NOT EXISTS admin_counters (
+        admin_counters_name VARCHAR(64) NOT NULL PRIMARY KEY,
+        admin_counters_value BIGINT NOT NULL DEFAULT 0
+    )
+"""
+
+ADMIN_COUNTERS_BACKFILL = """
+    INSERT INTO admin_counters (admin_counters_name, admin_counters_value)
+    SELECT 'unseen_orders', COUNT(*) FROM order_headers WHERE order_headers_seen = FALSE
+    ON DUPLICATE KEY UPDATE admin_counters_value = VALUES(admin_counters_value)
+"""
+
+SCHEMA_MIGRATIONS_TABLE = """
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        schema_migrations_version INT NOT NULL PRIMARY KEY,
+        schema_migrations_name VARCHAR(255) NOT NULL,
+        schema_migrations_applied_at DATETIME NOT NULL
+    )
+"""
+
+
+def index(table, name, columns):
+    return ('index', table, name, columns)
+
+
+def fulltext_index(table, name, columns):
+    return ('fulltext', table, name, columns)
+
+
+# Append new migrations at the end; applied versions are never re-run.
+MIGRATIONS = [
+    (1, 'customer_stats rollup', [
+        CUSTOMER_STATS_TABLE,
+        "DELETE FROM customer_stats",
+        CUSTOMER_STATS_BACKFILL
+    ]),
+    (2, 'order_headers', [
+        ORDER_HEADERS_TABLE,
+        "DELETE FROM order_headers",
+        ORDER_HEADERS_BACKFILL
+    ]),
+    (3, 'admin_counters', [
+        ADMIN_COUNTERS_TABLE,
+        ADMIN_COUNTERS_BACKFILL
+    ]),
+    (4, 'lookup indexes', [
+        index('images', 'images_products_id_idx', ['images_products_id']),
+        index('orders', 'orders_number_idx', ['orders_number']),
+        index('orders', 'orders_customers_id_idx', ['orders_customers_id']),
+        index('orders', 'orders_date_idx', ['orders_date']),
+        index('addresses', 'addresses_customers_id_idx', ['addresses_customers_id']),
+        index('contacts', 'contacts_customers_id_idx', ['contacts_customers_id']),
+        index('products', 'products_category_idx', ['products_category']),
+        index('customers', 'customers_email_idx', ['customers_email']),
+        index('customers', 'customers_name_idx', ['customers_first_name', 'customers_surname']),
+        index('administrators', 'administrators_email_idx', ['administrators_email'])
+    ]),
+    (5, 'cache versions', [
+        """
+            ALTER TABLE admin_counters
+            ADD COLUMN admin_counters_updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        """,
+        """
+            INSERT IGNORE INTO admin_counters (admin_counters_name, admin_counters_value)
+            VALUES ('catalog_version', 1), ('addresses_version', 1)
+        """
+    ]),
+    (6, 'product search index', [
+        fulltext_index('products', 'products_search_idx', ['products_name', 'products_description', 'products_material'])
+    ]),
+    (7, 'product filter indexes', [
+        index('products', 'products_price_idx', ['products_price']),
+        index('products', 'products_category_price_idx', ['products_category', 'products_price']),
+        index('products', 'products_material_price_idx', ['products_material', 'products_price']),
+        # covers the facet pass, including its price and stock filters, without reading rows
+        index('products', 'products_facets_idx', ['products_category', 'products_material', 'products_price', 'products_quantity'])
+    ])
+]
+
+
+def has_index(cur, table, columns, fulltext=False):
+    cur.execute("""
+        SELECT INDEX_NAME, GROUP_CONCAT(COLUMN_NAME ORDER BY SEQ_IN_INDEX)
+        FROM information_schema.STATISTICS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s AND (INDEX_TYPE = 'FULLTEXT') = %s
+        GROUP BY INDEX_NAME
+    """, (table, fulltext))
+    wanted = ','.join(columns)
+    if fulltext:
+        # MATCH() only uses a FULLTEXT index over exactly the same columns
+        return any(indexed == wanted for name, indexed in cur.fetchall())
+    return any(indexed == wanted or indexed.startswith(wanted + ',') for name, indexed in cur.fetchall())
+
+
+def apply_step(cur, step):
+    if isinstance(step, str):
+        cur.execute(step)
+        return
+    kind, table, name, columns = step
+    if kind == 'fulltext':
+        if not has_index(cur, table, columns, fulltext=True):
+            cur.execute(f"CREATE FULLTEXT INDEX {name} ON {table} ({', '.join(columns)})")
+        return
+    # an existing index with the same leading columns (for example one backing a foreign key) is enough
+    if not has_index(cur, table, columns):
+        cur.execute(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})")
+
+
+def applied_versions(connection):
+    cur = connection.cursor()
+    cur.execute(SCHEMA_MIGRATIONS_TABLE)
+    cur.execute("SELECT schema_migrations_version FROM schema_migrations")
+    versions = {row[0] for row in cur.fetchall()}
+    cur.close()
+    return versions
+
+
+def migrate(connection):
+    done = applied_versions(connection)
+    applied = []
+    for version, name, steps in MIGRATIONS:
+        if version in done:
+            continue
+        cur = connection.cursor()
+        try:
+            for step in steps:
+                apply_step(cur, step)
+            cur.execute("INSERT INTO schema_migrations (schema_migrations_version, schema_migrations_name, schema_migrations_applied_at) VALUES (%s, %s, NOW())",
+                        (version, name))
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        finally:
+            cur.close()
+        applied.append((version, name))
+    return applied
+
+
+def check_query_plans(connection, statements, min_rows=1000):
+    # statements are captured from real requests (app.capture_statements), with their parameters already filled in
+    cur = connection.cursor()
+    failures = []
+    for statement in statements:
+        cur.execute("EXPLAIN " + statement['statement'])
+        columns = [column[0].lower() for column in cur.description]
+        for row in cur.fetchall():
+            plan = dict(zip(columns, row))
+            table = plan.get('table') or ''
+            # derived tables and unions show up as <derived2> / <union1,2> and are built from the plans checked above
+            if plan.get('type') == 'ALL' and not table.startswith('<') and (plan.get('rows') or 0) >= min_rows:
+                failures.append({'route': statement['route'], 'query': statement['fingerprint'], 'table': table, 'rows': plan.get('rows'), 'extra': plan.get('extra')})
+    cur.close()
+    return failures
@@ -0,0 +1,106 @@
+import re
+
+import MySQLdb
+import pytest
+
+import app as application
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self.description = None
+        self.rowcount = 0
+        self.lastrowid = None
+        self._rows = []
+
+    def execute(self, query, args=None):
+        statement = ' '.join(query.split())
+        self.connection.database.statements.append(statement)
+        rows, self.rowcount, self.lastrowid = self.connection.database.result(statement)
+        self._rows = list(rows)
+        return self.rowcount
+
+    def executemany(self, query, args):
+        self.execute(query)
+        self.rowcount = len(args)
+        return self.rowcount
+
+    def mogrify(self, query, args=None):
+        return query if args is None else query % tuple(repr(arg) for arg in args)
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchmany(self, size):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, database):
+        self.database = database
+        self.closed = False
+        self.fail_ping = False
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self, *args):
+        return FakeCursor(self)
+
+    def ping(self):
+        if self.fail_ping:
+            raise MySQLdb.OperationalError(2006, 'MySQL server has gone away')
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.statements = []
+        self.connections = []
+        self._results = []
+
+    def respond(self, pattern, rows=(), rowcount=None, lastrowid=None):
+        # the first pattern that matches a statement decides its result; later calls take precedence
+        self._results.insert(0, (re.compile(pattern), list(rows), len(rows) if rowcount is None else rowcount, lastrowid))
+
+    def result(self, statement):
+        for pattern, rows, rowcount, lastrowid in self._results:
+            if pattern.search(statement):
+                return rows, rowcount, lastrowid
+        return [], 0, None
+
+    def connect(self):
+        connection = FakeConnection(self)
+        self.connections.append(connection)
+        return connection
+
+    def executed(self, prefix):
+        return [statement for statement in self.statements if statement.startswith(prefix)]
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    database = FakeDatabase()
+    database.pool = application.ConnectionPool(application.app)
+    monkeypatch.setattr(database.pool, '_connect', database.connect)
+    monkeypatch.setattr(application.mysql, 'pool', database.pool)
+    # cached counter values would skip the statements the tests look for
+    for version in (application.catalog_version, application.addresses_version):
+        monkeypatch.setattr(version, 'value', None)
+    return database
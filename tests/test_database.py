@@ -0,0 +1,172 @@
+import threading
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+import app as application
+
+
+@pytest.fixture
+def pool_limits(monkeypatch):
+    def set_limits(size, overflow, timeout):
+        monkeypatch.setitem(application.app.config, 'MYSQL_POOL_SIZE', size)
+        monkeypatch.setitem(application.app.config, 'MYSQL_POOL_MAX_OVERFLOW', overflow)
+        monkeypatch.setitem(application.app.config, 'MYSQL_POOL_TIMEOUT', timeout)
+    return set_limits
+
+
+def test_pool_reuses_released_connections(fake_db):
+    connection = fake_db.pool.checkout()
+    raw = connection.raw
+    connection.release()
+    again = fake_db.pool.checkout()
+    assert again.raw is raw
+    again.release()
+
+    stats = fake_db.pool.stats()
+    assert (stats['created'], stats['checkouts'], stats['in_use'], stats['idle']) == (1, 2, 0, 1)
+    assert raw.rollbacks == 2
+
+
+def test_pool_raises_when_exhausted(fake_db, pool_limits):
+    pool_limits(1, 0, 0.05)
+    held = fake_db.pool.checkout()
+    with pytest.raises(application.PoolExhausted):
+        fake_db.pool.checkout()
+
+    held.release()
+    fake_db.pool.checkout().release()
+    assert fake_db.pool.stats()['timeouts'] == 1
+
+
+def test_pool_hands_a_released_connection_to_a_waiter(fake_db, pool_limits):
+    pool_limits(1, 0, 5)
+    held = fake_db.pool.checkout()
+    threading.Timer(0.1, held.release).start()
+
+    waiting = fake_db.pool.checkout()
+    assert waiting.raw is held.raw
+    assert fake_db.pool.stats()['waits'] == 1
+    waiting.release()
+
+
+def test_pool_replaces_dead_and_discarded_connections(fake_db):
+    connection = fake_db.pool.checkout()
+    connection.raw.fail_ping = True
+    connection.release()
+    replacement = fake_db.pool.checkout()
+    assert replacement.raw is not connection.raw
+    assert connection.raw.closed
+    assert fake_db.pool.stats()['ping_failures'] == 1
+
+    replacement.release(discard=True)
+    assert replacement.raw.closed
+    assert fake_db.pool.stats()['open'] == 0
+
+
+def test_routes_answer_503_when_the_pool_is_exhausted(client, fake_db, pool_limits):
+    pool_limits(0, 0, 0)
+    response = client.patch('/customers/update_phone', json={'customers_id': 1, 'customers_phone_number': '+380000000000'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+
+
+def test_create_order_decrements_stock_in_one_statement(client, fake_db):
+    fake_db.respond(r'^UPDATE products p', rowcount=2)
+    response = client.post('/orders', json={
+        'orders_number': 'N1', 'orders_products_id': [1, 2, 2], 'orders_product_quantity': [1, 1, 1],
+        'orders_customers_id': 1, 'orders_addresses_id': 1, 'orders_total_price': '42.00', 'orders_transactions_id': 'T1'})
+    assert response.status_code == 201
+    assert len(fake_db.executed('UPDATE products p')) == 1
+    assert len(fake_db.executed('INSERT INTO orders ')) == 1
+    assert fake_db.executed('INSERT INTO orders ')[0].count('NOW()') == 3
+
+
+def test_create_order_reports_short_stock_and_rolls_back(client, fake_db):
+    fake_db.respond(r'^UPDATE products p', rowcount=1)
+    fake_db.respond(r'^SELECT products_id, products_quantity FROM products', rows=[(1, 5), (2, 1)])
+    response = client.post('/orders', json={
+        'orders_number': 'N2', 'orders_products_id': [1, 2, 3], 'orders_product_quantity': [1, 2, 1],
+        'orders_customers_id': 1, 'orders_addresses_id': 1, 'orders_total_price': '42.00', 'orders_transactions_id': 'T2'})
+    assert response.status_code == 409
+    assert [(line['line'], line['available'], line['error']) for line in response.get_json()['lines']] == \
+        [(1, 1, 'Insufficient stock'), (2, 0, 'Product not found')]
+    assert fake_db.executed('INSERT INTO orders ') == []
+    assert fake_db.connections[0].rollbacks >= 1
+
+
+def test_batch_update_checks_stock_under_lock(client, fake_db):
+    fake_db.respond(r'FOR UPDATE$', rows=[(1, 5), (2, 1)])
+    response = client.patch('/products', json=[{'products_id': 1, 'stock_delta': -2}, {'products_id': 2, 'stock_delta': -2}])
+    assert response.status_code == 409
+    assert response.get_json()['items'] == [{'index': 1, 'products_id': 2, 'available': 1, 'errors': ['Insufficient stock']}]
+    assert fake_db.executed('UPDATE products p') == []
+
+    response = client.patch('/products', json={'items': [{'products_id': 1, 'stock_delta': -2}, {'products_id': 2, 'fields': {'products_price': '9.50'}}]})
+    assert response.status_code == 200
+    assert response.get_json()['items'] == [{'products_id': 1, 'products_quantity': 3}, {'products_id': 2, 'products_quantity': 1}]
+    assert len(fake_db.executed('UPDATE products p')) == 1
+
+
+IMPORT_CSV = (
+    'products_name,products_category,products_description,products_material,products_quantity,products_price,images\n'
+    'Wool Hat,Hats,Warm,Wool,5,19.90,https://i.example.com/1.jpg|https://i.example.com/2.jpg\n'
+    'Scarf,Scarves,Long,Cotton,3,NaN,\n'
+    'Mittens,Gloves,Soft,Wool,7,12.00,\n'
+)
+
+
+def test_import_rejects_the_whole_file_on_errors(client, fake_db):
+    fake_db.respond(r'auto_increment_increment', rows=[(1,)])
+    response = client.post('/products/import', data=IMPORT_CSV, content_type='text/csv')
+    assert response.status_code == 422
+    assert response.get_json()['errors'] == [{'line': 3, 'errors': ['products_price must be a positive number']}]
+    assert fake_db.executed('INSERT INTO products') == []
+
+
+def test_partial_import_inserts_valid_rows_in_one_statement(client, fake_db):
+    fake_db.respond(r'auto_increment_increment', rows=[(2,)])
+    fake_db.respond(r'^INSERT INTO products', rowcount=2, lastrowid=101)
+    response = client.post('/products/import', query_string={'partial': 'true'}, data=IMPORT_CSV, content_type='text/csv')
+    assert response.status_code == 201
+    body = response.get_json()
+    assert (body['imported'], body['products_ids'], body['images'], body['error_count']) == (2, [101, 103], 2, 1)
+    assert len(fake_db.executed('INSERT INTO products')) == 1
+    assert len(fake_db.executed('INSERT INTO images')) == 1
+
+
+def test_export_returns_its_connection_after_the_download(client, fake_db):
+    fake_db.respond(r'FROM order_headers', rows=[('B1', date(2024, 1, 2), 1, 1, 'T1', Decimal('10.00'), 0)])
+    response = client.get('/orders/admin/export', query_string={'from': '2024-01-01', 'to': '2024-01-31'})
+    assert application.app.json.loads(response.get_data(as_text=True).splitlines()[0])['order_number'] == 'B1'
+    response.close()
+
+    stats = fake_db.pool.stats()
+    assert (stats['in_use'], stats['idle']) == (0, 1)
+    assert fake_db.statements[-1] == 'SET SESSION net_write_timeout = DEFAULT'
+    assert not fake_db.connections[0].closed
+
+
+def test_abandoned_export_discards_its_connection(client, fake_db):
+    fake_db.respond(r'FROM order_headers', rows=[('B1', date(2024, 1, 2), 1, 1, 'T1', Decimal('10.00'), 0)] * 5000)
+    response = client.get('/orders/admin/export', query_string={'from': '2024-01-01', 'to': '2024-01-31'})
+    response.close()
+
+    stats = fake_db.pool.stats()
+    assert (stats['in_use'], stats['open']) == (0, 0)
+    assert fake_db.connections[0].closed
+
+
+def test_add_customer_bumps_the_addresses_version(client, fake_db, monkeypatch):
+    monkeypatch.setattr(application.hash_pool, 'hashpw', lambda password: 'hashed')
+    bumps = []
+    monkeypatch.setattr(application.addresses_version, 'bump', lambda: bumps.append(True))
+    fake_db.respond(r'^INSERT INTO customers', rowcount=1, lastrowid=7)
+    response = client.post('/customers', json={
+        'first_name': 'Olena', 'surname': 'Test', 'email': 'olena@example.com', 'password': 'secret',
+        'address': {'street_one': '1 Main St', 'street_two': '', 'city': 'Kyiv', 'province': 'Kyiv', 'country': 'Ukraine', 'postal_code': '01001'},
+        'contact': {'phone_number': '+380000000000'}})
+    assert response.status_code == 201
+    assert response.get_json()['customer_id'] == 7
+    assert bumps == [True]
@@ -0,0 +1,154 @@
+import re
+from decimal import Decimal
+
+import pytest
+
+import app as application
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(application.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_fingerprint_collapses_literals_and_parameter_lists():
+    assert application.fingerprint_query("SELECT * FROM products WHERE products_id IN (%s, %s, %s)") == \
+        application.fingerprint_query("select *\n  from products where products_id in (7, 8) -- page 2")
+    assert application.fingerprint_query("SELECT * FROM customers WHERE customers_email = 'a@b.c'") == \
+        'select * from customers where customers_email = ?'
+
+
+def test_fingerprint_collapses_values_tuples_and_derived_rows():
+    two = application.fingerprint_query("INSERT INTO images (images_url, images_products_id) VALUES (%s, %s), (%s, %s)")
+    one = application.fingerprint_query("INSERT INTO images (images_url, images_products_id) VALUES (%s, %s)")
+    assert two == one
+    query, params = application.derived_table(['products_id', 'quantity'], [(1, 2), (3, 4), (5, 6)])
+    shorter, _ = application.derived_table(['products_id', 'quantity'], [(1, 2)])
+    assert params == [1, 2, 3, 4, 5, 6]
+    assert application.fingerprint_query(query) == application.fingerprint_query(shorter + " UNION ALL SELECT %s, %s")
+
+
+def test_login_throttle_blocks_until_the_window_passes(clock):
+    throttle = application.LoginThrottle(window=60, max_keys=10)
+    for _ in range(3):
+        throttle.record_failure(['email:a@b.c', 'ip:10.0.0.1'])
+
+    assert throttle.retry_after([('email:a@b.c', 4)]) == 0
+    assert throttle.retry_after([('email:a@b.c', 3)]) == 61
+    clock[0] += 30
+    assert throttle.retry_after([('ip:10.0.0.1', 3)]) == 31
+    clock[0] += 31
+    assert throttle.retry_after([('email:a@b.c', 3)]) == 0
+
+
+def test_login_throttle_reset_and_eviction(clock):
+    throttle = application.LoginThrottle(window=60, max_keys=2)
+    throttle.record_failure(['email:a@b.c'])
+    throttle.reset('email:a@b.c')
+    assert throttle.retry_after([('email:a@b.c', 1)]) == 0
+
+    for key in ('a', 'b', 'c'):
+        throttle.record_failure([key])
+    assert throttle.retry_after([('a', 1)]) == 0
+    assert throttle.retry_after([('c', 1)]) == 61
+
+
+def test_catalog_cache_drops_entries_from_older_versions(clock):
+    cache = application.CatalogCache(max_entries=10, ttl=60)
+    cache.sync(1)
+    cache.set('page-1', ['product'], 1)
+    # a value read under an older version must not be cached once the catalog moved on
+    cache.set('page-2', ['stale'], 0)
+    assert cache.get('page-1') == ['product']
+    assert cache.get('page-2') is None
+
+    cache.sync(2)
+    assert cache.get('page-1') is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_catalog_cache_expires_and_evicts(clock):
+    cache = application.CatalogCache(max_entries=2, ttl=60)
+    cache.sync(1)
+    for key in ('a', 'b', 'c'):
+        cache.set(key, key, 1)
+    assert cache.get('a') is None
+    assert cache.evictions == 1
+
+    clock[0] += 61
+    assert cache.get('c') is None
+
+
+def test_cursors_round_trip():
+    assert application.decode_cursor(application.encode_cursor(42)) == (42,)
+    cursor = application.encode_cursor(Decimal('19.99'), 7)
+    assert '=' not in cursor
+    assert application.decode_cursor(cursor, 'price_asc') == (Decimal('19.99'), 7)
+
+
+@pytest.mark.parametrize('price', ['NaN', 'Infinity', '-Infinity'])
+def test_price_cursor_rejects_non_finite_prices(price):
+    with pytest.raises(ValueError):
+        application.decode_cursor(application.encode_cursor(price, 1), 'price_desc')
+
+
+def test_validate_import_record_accepts_a_complete_row():
+    values, images, errors = application.validate_import_record({
+        'products_name': ' Wool Hat ', 'products_category': 'Hats', 'products_description': 'Warm', 'products_material': 'Wool',
+        'products_quantity': '5', 'products_price': '19.90', 'images': 'https://i.example.com/1.jpg | https://i.example.com/2.jpg'})
+    assert errors == []
+    assert values == ['Wool Hat', 'Hats', 'Warm', 'Wool', 5, Decimal('19.90')]
+    assert images == ['https://i.example.com/1.jpg', 'https://i.example.com/2.jpg']
+
+
+def test_validate_import_record_reports_every_problem():
+    values, images, errors = application.validate_import_record({
+        'products_name': '', 'products_category': 'Hats', 'products_description': 'Warm', 'products_material': 'Wool',
+        'products_quantity': '-1', 'products_price': 'NaN', 'images': ['ftp://i.example.com/1.jpg']})
+    assert errors == ['products_name is required', 'products_quantity must not be negative',
+                      'products_price must be a positive number', 'images must be http(s) URLs']
+    assert images == []
+
+
+def test_validate_batch_item():
+    seen_ids = set()
+    (products_id, values), errors = application.validate_batch_item(
+        {'products_id': 3, 'fields': {'products_price': '12.50'}, 'stock_delta': -2}, seen_ids)
+    assert errors == []
+    assert products_id == 3 and seen_ids == {3}
+    assert values['products_price'] == Decimal('12.50') and values['stock_delta'] == -2
+
+    _, errors = application.validate_batch_item({'products_id': 3, 'stock_delta': 1}, seen_ids)
+    assert errors == ['products_id appears more than once']
+    _, errors = application.validate_batch_item(
+        {'products_id': 4, 'fields': {'products_quantity': 5, 'products_id': 9}, 'stock_delta': 1}, seen_ids)
+    assert errors == ['products_id cannot be updated', 'use either fields.products_quantity or stock_delta']
+    _, errors = application.validate_batch_item({'products_id': True}, seen_ids)
+    assert errors == ['products_id must be a positive integer', 'nothing to update']
+
+
+def test_highlight_escapes_around_matches():
+    pattern = re.compile(r'\b(?:wool)\w*', re.IGNORECASE)
+    assert application.highlight('<b>Woolen</b> & hat', pattern) == '&lt;b&gt;<mark>Woolen</mark>&lt;/b&gt; &amp; hat'
+    assert application.highlight('', pattern) == ''
+
+
+def test_highlight_cuts_a_snippet_around_the_first_match():
+    pattern = re.compile(r'\b(?:wool)\w*', re.IGNORECASE)
+    snippet = application.highlight('cotton ' * 20 + 'wool ' + 'linen ' * 20, pattern, 40)
+    assert snippet.startswith('…') and snippet.endswith('…')
+    assert '<mark>wool</mark>' in snippet
+
+
+def test_search_terms_leave_out_stopwords_and_short_words():
+    assert application.search_terms('Blanket for the baby') == ['blanket', 'baby']
+    assert application.search_terms('XL scarf with wool WOOL') == ['scarf', 'wool']
+    assert application.search_terms('in a to XL') == []
+    assert application.search_against(application.search_terms('XL scarf for baby')) == '+scarf* +baby*'
+
+
+def test_search_terms_cap_counts_only_searchable_words(monkeypatch):
+    monkeypatch.setitem(application.app.config, 'SEARCH_MAX_TERMS', 2)
+    assert application.search_terms('a hat for the cold winter') == ['hat', 'cold']
@@ -0,0 +1,70 @@
+import base64
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+import pytest
+
+import app as application
+
+
+class StubImageHost(BaseHTTPRequestHandler):
+    def do_POST(self):
+        form = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+        status, body = self.server.respond(base64.b64decode(form['image'][0]).decode('utf-8'))
+        body = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def image_host(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StubImageHost)
+    server.respond = lambda name: (200, {'data': {'link': f'https://i.example.com/{name}.jpg'}})
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setitem(application.app.config, 'IMAGE_UPLOAD_URL', f'http://127.0.0.1:{server.server_address[1]}/3/image')
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_images_upload_concurrently_and_keep_their_order(image_host):
+    workers = application.app.config['IMAGE_UPLOAD_WORKERS']
+    barrier = threading.Barrier(workers, timeout=5)
+
+    def respond(name):
+        # no upload is answered until all of them are in flight, and the last image answers first
+        barrier.wait()
+        time.sleep(0.05 * (workers - int(name)))
+        return 200, {'data': {'link': f'https://i.example.com/{name}.jpg'}}
+
+    image_host.respond = respond
+    results = application.upload_images_to_host([str(i).encode('utf-8') for i in range(workers)])
+    assert results == [(f'https://i.example.com/{i}.jpg', None) for i in range(workers)]
+
+
+def test_slow_host_times_out_with_504(image_host, monkeypatch):
+    monkeypatch.setitem(application.app.config, 'IMAGE_UPLOAD_READ_TIMEOUT', 0.2)
+    answer = threading.Event()
+    image_host.respond = lambda name: (answer.wait(5), (200, {'data': {'link': 'https://i.example.com/late.jpg'}}))[1]
+
+    [(link, error)] = application.upload_images_to_host([b'0'])
+    answer.set()
+    assert link is None
+    assert error[1] == 504
+
+
+def test_host_errors_are_passed_through(image_host):
+    image_host.respond = lambda name: (400, {'data': {'error': 'Image format not supported'}, 'status': 400})
+
+    results = application.upload_images_to_host([b'0', b'1'])
+    assert [error[1] for link, error in results] == [400, 400]
+    assert json.loads(results[0][1][0])['data']['error'] == 'Image format not supported'
@@ -0,0 +1,34 @@
+import MySQLdb
+import pytest
+
+import app as application
+
+
+@pytest.fixture
+def database():
+    try:
+        connection = application.mysql.pool.checkout()
+    except MySQLdb.Error:
+        pytest.skip('MySQL is not reachable')
+    connection.release()
+
+
+def test_products_rejects_non_finite_prices(client):
+    response = client.get('/products', query_string={'min_price': 'NaN'})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'min_price and max_price must be numbers'}
+
+
+def test_products_page(client, database):
+    response = client.get('/products', query_string={'page': 1, 'facets': 'true'})
+    assert response.status_code == 200
+    body = response.get_json()
+    assert len(body['products']) <= 20
+    assert set(body) >= {'products', 'total', 'facets'}
+    assert response.headers['ETag']
+
+
+def test_home_lists_every_route(client):
+    listed = {key.split(' ')[-1].split('?')[0] for key in client.get('/').get_json()['message']}
+    rules = {rule.rule for rule in application.app.url_map.iter_rules() if rule.endpoint not in ('static', 'catch_all', 'home')}
+    assert rules <= listed